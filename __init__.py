@@ -5,6 +5,12 @@ from .nodes.predict import *
 from .nodes.text_field import *
 from .nodes.prompt_builder import *
 from .nodes.model import *
+from .nodes.map_reduce import *
+from .nodes.async_predict import *
+from .nodes.retrieval import *
+from .nodes.embeddings import *
+from .nodes.fork_conversation import *
+from .nodes.sample_predict import *
 
 NODE_CLASS_MAPPINGS = {
     f"Text Field": TextField,
@@ -13,6 +19,13 @@ NODE_CLASS_MAPPINGS = {
     f"Predict": Predict,
     f"Model V2": ModelV2,
     f"Predict V2": PredictV2,
+    f"Map Reduce": MapReduce,
+    f"Predict Submit": PredictSubmit,
+    f"Predict Await": PredictAwait,
+    f"Retrieve": Retrieve,
+    f"Similarity Search": SimilaritySearch,
+    f"Fork Conversation": ForkConversation,
+    f"Predict Samples": PredictSamples,
 }
 
 print("\033[34mComfyUI LLM Nodes: \033[92mLoaded\033[0m")
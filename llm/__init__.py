@@ -1,10 +1,21 @@
-from .openai import BaseOpenAI
-from .anthropic import BaseAnthropic
+import importlib
 from .custom_typing import Conversation, SystemMessage, UserMessage, AssistantMessage
+from .registry import get_vendor, register_vendor, register_openai_compatible
 from typing import Dict
 
+
+# the builtin backends (and their SDKs) are only imported when first used
+_BACKENDS = {"BaseOpenAI": ".openai", "BaseAnthropic": ".anthropic"}
+
+
+def __getattr__(name: str):
+    if name in _BACKENDS:
+        return getattr(importlib.import_module(_BACKENDS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 class LLM:
-    def __init__(self, vendor: str, model: str, model_params: Dict[str, str] = {}, conversation: Conversation = Conversation(messages=[]), stateful: bool = True):
+    def __init__(self, vendor: str, model: str, model_params: Dict[str, str] = None, conversation: Conversation = None, stateful: bool = True):
         self.vendor = vendor
         self.kwargs = {
             "model": model,
@@ -13,9 +24,4 @@ class LLM:
             "stateful": stateful
         }
     def __call__(self):
-        if self.vendor == BaseOpenAI.VENDOR:
-            return BaseOpenAI(**self.kwargs)
-        elif self.vendor == BaseAnthropic.VENDOR:
-            return BaseAnthropic(**self.kwargs)
-        else:
-            raise ValueError(f"Unknown vendor: {self.vendor}")
+        return get_vendor(self.vendor)(**self.kwargs)
@@ -1,28 +1,118 @@
-import os
-from typing import Dict
-from copy import deepcopy
-from anthropic import Anthropic
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+from anthropic import Anthropic, APIConnectionError, BadRequestError, NotFoundError
 from loguru import logger
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
 from .constants import SUPPORTED_MODELS
-from .custom_typing import Conversation, UserMessage, AssistantMessage
+from .custom_typing import Conversation, Message, UserMessage, AssistantMessage
 from .base_llm import BaseLLM
-
-ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY)
+from .pool import Endpoint, EndpointPool
+from .token_budget import ContextWindowExceeded
+from .tracing import span, trace_retry
+from .uploads import FileUploadManager
 
 class BaseAnthropic(BaseLLM):
     VENDOR = "anthropic"
     ALLOWED_MODELS = SUPPORTED_MODELS[VENDOR]
+    API_KEY_ENV = "ANTHROPIC_API_KEY"
+    BASE_URL = None
+    SUPPORTS_FILE_UPLOADS = True
+    FILES_BETA = "files-api-2025-04-14"
 
-    def __init__(self, model: str, model_params: Dict[str, str] = {}, conversation: Conversation = Conversation(messages=[]), stateful: bool = True):
-        logger.info(f"Initializing Anthropic with model: {model}, stateful: {stateful}")
-        if model not in self.ALLOWED_MODELS:
-            raise ValueError(f"Model {model} is not supported")
+    def __init__(self, model: str, model_params: Dict[str, str] = None, conversation: Conversation = None, stateful: bool = True):
+        logger.info("Initializing Anthropic with model: {}, stateful: {}", model, stateful)
+        self.validate_model(model)
         super().__init__(self.VENDOR, model, model_params, conversation, stateful)
 
-    def __convert_conversation_to_messages(self, conversation: Conversation):
-        logger.debug("Converting conversation to Anthropic message format")
+    @classmethod
+    def default_endpoints(cls) -> List[Dict[str, Any]]:
+        return [{"api_key_env": cls.API_KEY_ENV, "base_url": cls.BASE_URL}]
+
+    @classmethod
+    def get_pool(cls) -> EndpointPool:
+        # created on first use, one pool per backend class, with a client (and connection pool) per endpoint
+        with cls._class_lock:
+            if cls.__dict__.get("_pool") is None:
+                cls._pool = EndpointPool.from_config(cls.VENDOR, Anthropic, cls.default_endpoints(), connection_errors=(APIConnectionError,))
+            return cls._pool
+
+    @classmethod
+    def get_client(cls) -> Anthropic:
+        return cls.get_pool().select().client
+
+    @classmethod
+    def get_upload_manager(cls, endpoint: Endpoint) -> FileUploadManager:
+        # file ids only exist for the key that uploaded them
+        with cls._class_lock:
+            if cls.__dict__.get("_upload_managers") is None:
+                cls._upload_managers = {}
+            if endpoint.name not in cls._upload_managers:
+                def upload_file(data: bytes, media_type: str, filename: str) -> str:
+                    return endpoint.client.beta.files.upload(file=(filename, data, media_type), betas=[cls.FILES_BETA]).id
+                def delete_file(file_id: str):
+                    endpoint.client.beta.files.delete(file_id, betas=[cls.FILES_BETA])
+                cls._upload_managers[endpoint.name] = FileUploadManager(upload_file, delete_file)
+            return cls._upload_managers[endpoint.name]
+
+    def _reference_files(self, messages, endpoint: Endpoint):
+        """
+        replaces inline base64 images by references to uploaded files, images that fail to upload stay inline.
+        returns the new messages and the file ids they reference
+        """
+        images = [
+            (block["source"]["data"], block["source"]["media_type"])
+            for message in messages if isinstance(message["content"], list)
+            for block in message["content"] if block["type"] == "image" and block["source"]["type"] == "base64"
+        ]
+        if not images:
+            return messages, []
+
+        file_ids = self.get_upload_manager(endpoint).file_ids(images)
+        referenced_messages = []
+        for message in messages:
+            if not isinstance(message["content"], list) or not any(block["type"] == "image" for block in message["content"]):
+                referenced_messages.append(message)
+                continue
+            content = []
+            for block in message["content"]:
+                file_id = file_ids.get(block["source"]["data"]) if block["type"] == "image" and block["source"]["type"] == "base64" else None
+                content.append({"type": "image", "source": {"type": "file", "file_id": file_id}} if file_id else block)
+            referenced_messages.append({**message, "content": content})
+        return referenced_messages, [file_id for file_id in file_ids.values() if file_id]
+
+    def _create_message(self, client: Anthropic, system_text, messages, params, file_ids):
+        if file_ids:
+            return client.beta.messages.with_raw_response.create(
+                model=self.model,
+                system=system_text,
+                messages=messages,
+                betas=[self.FILES_BETA],
+                **params
+            )
+        return client.messages.with_raw_response.create(
+            model=self.model,
+            system=system_text,
+            messages=messages,
+            **params
+        )
+
+    def _send(self, endpoint: Endpoint, system_text, messages, params):
+        file_ids = []
+        request_messages = messages
+        if self.upload_images:
+            with span("reference_files"):
+                request_messages, file_ids = self._reference_files(messages, endpoint)
+        try:
+            return self._create_message(endpoint.client, system_text, request_messages, params, file_ids)
+        except (NotFoundError, BadRequestError) as e:
+            if not file_ids:
+                raise
+            # uploaded files can be deleted or expire before our cache entry does
+            logger.warning("Request with uploaded files failed, retrying with inline images: {}", e)
+            self.get_upload_manager(endpoint).invalidate(file_ids)
+            return self._create_message(endpoint.client, system_text, messages, params, [])
+
+    def _convert_message(self, message: Message):
         """
         convert this format of conversation:
         data structure for a conversation:
@@ -59,68 +149,109 @@ class BaseAnthropic(BaseLLM):
                     {"type": "text", "text": user_prompt},
                 ]}
             ]
+
+        tool calls and tool results become "tool_use" and "tool_result" content blocks
         """
-        final_messages = []
-        for message in conversation.messages:
-            if message.role == "system":
-                final_messages.append({"role": "system", "content": message.content})
-            elif message.role == "user":
-                user_content = []
-                for content_item in message.content:
-                    if content_item.type == "text":
-                        user_content.append({"type": "text", "text": content_item.text})
-                    elif content_item.type == "image":
-                        user_content.append({
-                            "type": "image",
-                            "source": {
-                                "type": content_item.source.type,
-                                "media_type": content_item.source.media_type,
-                                "data": content_item.source.data
-                            }
-                        })
-                final_messages.append({"role": "user", "content": user_content})
-            elif message.role == "assistant":
-                final_messages.append({"role": "assistant", "content": message.content})
-        logger.debug(f"Converted {len(conversation.messages)} messages to Anthropic format")
-        return final_messages
-
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    def _run_messages(self):
-        logger.info("Running messages through OpenAI API")
-        messages = self.__convert_conversation_to_messages(self.conversation)
-        messages = deepcopy(messages)
+        if message.role == "system":
+            return [{"role": "system", "content": message.content}]
+        content = []
+        for content_item in message.content:
+            if content_item.type == "text":
+                # empty text blocks are rejected, e.g. the text of an assistant message that only calls tools
+                if content_item.text:
+                    content.append({"type": "text", "text": content_item.text})
+            elif content_item.type == "image":
+                content.append({
+                    "type": "image",
+                    "source": {
+                        "type": content_item.source.type,
+                        "media_type": content_item.source.media_type,
+                        "data": content_item.source.data
+                    }
+                })
+            elif content_item.type == "tool_use":
+                content.append({"type": "tool_use", "id": content_item.id, "name": content_item.name, "input": content_item.input})
+            elif content_item.type == "tool_result":
+                content.append({"type": "tool_result", "tool_use_id": content_item.tool_use_id, "content": content_item.content, "is_error": content_item.is_error})
+        return [{"role": message.role, "content": content}]
+
+    def _parse_assistant_message(self, response) -> AssistantMessage:
+        content = []
+        for block in response.content:
+            if block.type == "text":
+                content.append({"type": "text", "text": block.text})
+            elif block.type == "tool_use":
+                content.append({"type": "tool_use", "id": block.id, "name": block.name, "input": block.input})
+        if not content:
+            content.append({"type": "text", "text": ""})
+        return AssistantMessage(content=content, finish_reason=response.stop_reason)
+
+    def tool_params(self):
+        return {"tools": [
+            {"name": tool.name, "description": tool.description, "input_schema": tool.parameters}
+            for tool in self.tools
+        ]}
+
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), retry=retry_if_not_exception_type(ContextWindowExceeded), before_sleep=trace_retry)
+    def _run_messages(self, record: bool = None):
+        logger.info("Running messages through Anthropic API")
+        with span("convert_messages", vendor=self.VENDOR, num_messages=len(self.conversation.messages)):
+            # a new list, but the converted messages are cached and shared: they are never modified
+            messages = self.convert_conversation()
         try:
             # pop the first system message out and store the system message in a text variable "system" and pass to anthropic client
             system_message = messages.pop(0)
             system_text = system_message["content"]
-            if "max_tokens" not in self.model_params:
-                self.model_params["max_tokens"] = 4000
-            response = anthropic_client.messages.create(
-                model=self.model,
-                system=system_text,
-                messages=messages,
-                **self.model_params
-            )
+            params = self.request_params()
+            with span("api_call", vendor=self.VENDOR, model=self.model):
+                response = self.get_pool().request(lambda endpoint: self._send(endpoint, system_text, messages, params))
             logger.debug("Successfully received response from Anthropic API")
-            output_text = response.content[0].text
+            if response.usage:
+                self.add_output_tokens(response.usage.output_tokens)
+            with span("build_assistant_message"):
+                assistant_message = self._parse_assistant_message(response)
+            output_text = self.message_text(assistant_message)
 
-            if self.stateful:
-                assistant_message = AssistantMessage(content=[{"type": "text", "text": output_text}], finish_reason=response.stop_reason)
+            if self.stateful if record is None else record:
                 self.add_message_to_conversation(assistant_message)
                 logger.debug("Added assistant message to conversation")
             return output_text, response
         except Exception as e:
-            logger.error(f"Error occurred while running messages: {str(e)}")
+            logger.error("Error occurred while running messages: {}", e)
             raise
 
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), retry=retry_if_not_exception_type(ContextWindowExceeded), before_sleep=trace_retry)
+    def _sample_messages(self, n: int) -> List[AssistantMessage]:
+        # Anthropic has no n parameter: concurrent requests sharing one converted payload
+        with span("convert_messages", vendor=self.VENDOR, num_messages=len(self.conversation.messages)):
+            messages = self.convert_conversation()
+        system_text = messages.pop(0)["content"]
+        params = self.request_params()
+
+        def create(_):
+            return self.get_pool().request(lambda endpoint: self._send(endpoint, system_text, messages, params))
+
+        with span("api_call", vendor=self.VENDOR, model=self.model, n=n):
+            # a local pool, the caller may itself be running on llm.executor
+            with ThreadPoolExecutor(max_workers=n) as executor:
+                responses = list(executor.map(create, range(n)))
+
+        for response in responses:
+            if response.usage:
+                self.add_output_tokens(response.usage.output_tokens)
+        return [self._parse_assistant_message(response) for response in responses]
+
     def _run_messages_until_completion(self, until_completion_user_message: UserMessage):
         logger.info("Running messages until completion")
         assert self.stateful, "stateful must be True to run until completion"
         
+        round_number = 0
         while True:
-            logger.debug("Running model iteration")
-            _, response = self._run_messages()
-            logger.debug(f"Response: {response}")
+            round_number += 1
+            logger.debug("Running model iteration {}", round_number)
+            with span("continuation_round", round=round_number):
+                _, response = self._run_messages()
+            logger.debug("Response: {}", response)
             finish_reason = response.stop_reason
             
             if finish_reason in ["end_turn", "stop_sequence"]:
@@ -130,13 +261,13 @@ class BaseAnthropic(BaseLLM):
                 logger.warning("Incomplete model output due to max_tokens parameter or token limit")
                 continue
             elif finish_reason == "tool_use":
-                logger.error("Model called a function, which is not supported yet")
-                raise NotImplementedError("Function calling is not supported yet")
+                logger.error("Model called a function, but no tools were added to the LLM")
+                raise NotImplementedError("Function calling requires tools, add them with add_tool")
             elif finish_reason in ["null", None]:
                 logger.error("Model did not generate any content")
                 raise RuntimeError("Model did not generate any content")
             else:
-                logger.warning(f"Unknown finish reason: {finish_reason}")
+                logger.warning("Unknown finish reason: {}", finish_reason)
                 return
 
     def run(
@@ -145,14 +276,21 @@ class BaseAnthropic(BaseLLM):
         until_completion_user_message: UserMessage = None,
         cleanup_completion: bool = True
     ):
-        logger.info(f"Running Anthropic with until_completion: {until_completion}")
-        if until_completion:
+        logger.info("Running Anthropic with until_completion: {}", until_completion)
+        self.last_output_tokens = 0
+        if self.tools:
+            with span("run_agent", vendor=self.VENDOR, model=self.model):
+                output_text = self.run_agent()
+        elif until_completion:
             if not until_completion_user_message:
                 until_completion_user_message = self.default_until_completion_user_message
-            output_text = self._run_messages_until_completion(until_completion_user_message)
-            if cleanup_completion:
-                self.cleanup_completion(output_text, until_completion_user_message)
+            with span("run_until_completion", vendor=self.VENDOR, model=self.model):
+                output_text = self._run_messages_until_completion(until_completion_user_message)
+                if cleanup_completion:
+                    self.cleanup_completion(output_text, until_completion_user_message)
         else:
-            output_text, response = self._run_messages()
+            with span("run", vendor=self.VENDOR, model=self.model):
+                output_text, response = self._run_messages()
+        self.record_output_tokens()
         logger.info("Completed running Anthropic")
         return output_text
@@ -1,21 +1,66 @@
-from typing import Any, List, Dict
-from .custom_typing import Conversation, Message, UserMessage
+import ast
+import json
+import time
+from threading import RLock
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Dict, Tuple
+import numpy as np
+from loguru import logger
+from .constants import MODEL_CAPABILITIES, DEFAULT_MODEL_CAPABILITIES
+from .custom_typing import Conversation, Message, UserMessage, AssistantMessage
+from .embeddings import embedding_batches
+from .token_budget import size_max_tokens, record_output_tokens, observed_output_tokens
+from .tokenizer import estimate_conversation_tokens
+from .tools import Tool, ToolExecutor
+from .tracing import span
+from .voting import majority_vote
 
 class BaseLLM:
+    ALLOWED_MODELS: List[str] = []
+    # per model overrides of MODEL_CAPABILITIES
+    CAPABILITIES: Dict[str, Dict[str, int]] = {}
+    # seconds a model list discovered at runtime is reused for
+    MODEL_LIST_TTL = 300
+    # model lists are fetched while the UI builds its node inputs, so a server that is down must fail fast
+    MODEL_LIST_TIMEOUT = 5
+    # whether images can be uploaded once and referenced by file id (upload_images)
+    SUPPORTS_FILE_UPLOADS = False
+    # None for vendors without an embeddings API
+    EMBEDDING_MODEL: str = None
+    # vendor limits per embeddings request
+    EMBEDDING_BATCH_SIZE = 2048
+    EMBEDDING_BATCH_TOKENS = 300000
+    # guards the per-class objects created on first use (pools, upload managers), which concurrent requests share
+    _class_lock = RLock()
+
     def __init__(
         self,
         vendor: str,
         model: str,
-        model_params: Dict[str, Any] = {},
-        conversation: Conversation = Conversation(messages=[]),
+        model_params: Dict[str, Any] = None,
+        conversation: Conversation = None,
         stateful: bool = True
     ):
         self.vendor = vendor
         self.model = model
-        self.model_params = model_params
+        self.model_params = model_params if model_params is not None else {}
 
-        self.conversation = conversation
+        # never share a default conversation between instances
+        self.conversation = conversation if conversation is not None else Conversation(messages=[])
         self.stateful = stateful
+        # held while a prompt is added and run, so concurrent runs on one (session) LLM don't interleave
+        self.run_lock = RLock()
+        # set when the LLM is owned by the session registry
+        self.session_id = None
+        # output lengths are tracked per budget key (e.g. the node running the LLM) to size max_tokens
+        self.budget_key = None
+        self.last_output_tokens = 0
+
+        # upload images to the vendor's file storage once instead of sending them inline with every request
+        self.upload_images = False
+
+        self.tools: List[Tool] = []
+        self._tool_executor = None
 
         self.default_until_completion_user_message = UserMessage(
             content=[
@@ -32,6 +77,215 @@ class BaseLLM:
     def run(self, until_completion: bool = False, until_completion_user_message: UserMessage = None):
         raise NotImplementedError("run must be implemented by subclass")
 
+    def _run_messages(self, record: bool = None):
+        raise NotImplementedError("_run_messages must be implemented by subclass")
+
+    """
+    TOOLS
+    """
+    def add_tool(self, tool: Tool):
+        self.tools.append(tool)
+        self._tool_executor = None
+
+    def tool_params(self) -> Dict[str, Any]:
+        """
+        request params declaring self.tools, in the vendor's format
+        """
+        raise NotImplementedError("tool_params must be implemented by subclass")
+
+    def run_agent(self, max_steps: int = 10, max_seconds: float = None) -> str:
+        """
+        Runs the model, executes the tools it calls (concurrently, when it calls several at once) and feeds the results back
+        until it answers without calling a tool. Raises if that takes more than max_steps requests or max_seconds.
+        Tool calls and results are kept in the conversation if the LLM is stateful.
+        """
+        if not self.tools:
+            raise ValueError("run_agent requires at least one tool")
+        if self._tool_executor is None:
+            self._tool_executor = ToolExecutor(self.tools)
+
+        initial_messages = self.conversation.messages.fork()
+        deadline = time.monotonic() + max_seconds if max_seconds else None
+        try:
+            for step in range(1, max_steps + 1):
+                with span("agent_step", step=step):
+                    output_text, _ = self._run_messages(record=True)
+                    calls = [item for item in self.conversation.messages[-1].content if item.type == "tool_use"]
+                    if not calls:
+                        return output_text
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise RuntimeError(f"Agent exceeded its latency budget of {max_seconds}s after {step} steps")
+
+                    logger.info("Step {}: running {} tool calls", step, len(calls))
+                    results = self._tool_executor.run(calls, deadline=deadline)
+                    self.add_message_to_conversation(UserMessage(content=results))
+            raise RuntimeError(f"Agent did not finish within {max_steps} steps")
+        finally:
+            if not self.stateful:
+                self.conversation.messages = initial_messages
+
+    """
+    SAMPLING
+    """
+    def _sample_messages(self, n: int) -> List[AssistantMessage]:
+        """
+        n independent answers to the current conversation, without adding them to it
+        """
+        raise NotImplementedError("_sample_messages must be implemented by subclass")
+
+    def sample(self, n: int, voter: Callable[[List[str]], int] = None) -> Tuple[str, List[str]]:
+        """
+        generates n answers and picks one with voter (candidate texts -> winning index, majority_vote by default).
+        returns the winning text and all candidates; the winner is added to the conversation if stateful
+        """
+        if self.tools:
+            raise ValueError("sample does not support tools")
+        self.last_output_tokens = 0
+        with span("sample", vendor=self.vendor, model=self.model, n=n):
+            candidates = self._sample_messages(n)
+        texts = [self.message_text(message) for message in candidates]
+        with span("vote", candidates=len(texts)):
+            winner = (voter or majority_vote)(texts)
+        logger.info("Sample {} of {} won the vote", winner + 1, len(texts))
+
+        if self.stateful:
+            self.add_message_to_conversation(candidates[winner])
+        # max_tokens is sized for one answer
+        self.last_output_tokens //= max(len(candidates), 1)
+        self.record_output_tokens()
+        return texts[winner], texts
+
+    """
+    EMBEDDINGS
+    """
+    @classmethod
+    def _embed_batch(cls, texts: List[str], model: str) -> np.ndarray:
+        raise NotImplementedError(f"{cls.__name__} has no embeddings API")
+
+    @classmethod
+    def embed(cls, texts: List[str], model: str = None, max_concurrency: int = 4) -> np.ndarray:
+        """
+        float32 (len(texts), dim) embeddings, in batches up to the vendor's limits sent concurrently
+        """
+        model = model or cls.EMBEDDING_MODEL
+        if model is None:
+            raise NotImplementedError(f"{cls.__name__} has no embeddings API")
+        batches = embedding_batches(texts, cls.EMBEDDING_BATCH_SIZE, cls.EMBEDDING_BATCH_TOKENS)
+        if not batches:
+            return np.zeros((0, 0), dtype=np.float32)
+        with span("embed", model=model, texts=len(texts), batches=len(batches)):
+            if len(batches) == 1:
+                return cls._embed_batch(batches[0], model)
+            with ThreadPoolExecutor(max_workers=min(max_concurrency, len(batches))) as executor:
+                return np.concatenate(list(executor.map(lambda batch: cls._embed_batch(batch, model), batches)))
+
+    """
+    MODELS
+    """
+    @classmethod
+    def list_models(cls) -> List[str]:
+        """
+        models served by this backend, backends that discover their models at runtime override this
+        """
+        return list(cls.ALLOWED_MODELS)
+
+    @classmethod
+    def available_models(cls, refresh: bool = False) -> List[str]:
+        """
+        list_models, cached per backend class for MODEL_LIST_TTL seconds; failures are cached too,
+        so an unreachable server is asked again only after the TTL
+        """
+        cached = cls.__dict__.get("_models_cache")
+        if refresh or cached is None or time.monotonic() - cached[0] > cls.MODEL_LIST_TTL:
+            try:
+                cached = (time.monotonic(), cls.list_models(), None)
+            except Exception as e:
+                cached = (time.monotonic(), None, e)
+            cls._models_cache = cached
+        if cached[2] is not None:
+            raise cached[2]
+        return cached[1]
+
+    @classmethod
+    def validate_model(cls, model: str):
+        if model not in cls.available_models():
+            raise ValueError(f"Model {model} is not supported")
+
+    @classmethod
+    def model_capabilities(cls, model: str) -> Dict[str, int]:
+        return {**DEFAULT_MODEL_CAPABILITIES, **MODEL_CAPABILITIES.get(model, {}), **cls.CAPABILITIES.get(model, {})}
+
+    """
+    REQUEST
+    """
+    def _convert_message(self, message: Message) -> List[Dict[str, Any]]:
+        """
+        converts one message to the vendor's format (which can take more than one vendor message)
+        """
+        raise NotImplementedError("_convert_message must be implemented by subclass")
+
+    def convert_conversation(self) -> List[Dict[str, Any]]:
+        """
+        the conversation in the vendor's format; conversions are cached on the message nodes, so messages converted
+        for a previous request (or by another fork sharing them) are reused and the returned dicts must not be modified
+        """
+        backend = type(self)
+        final_messages = []
+        for node in self.conversation.messages.nodes():
+            converted = node.conversions.get(backend)
+            if converted is None:
+                converted = node.conversions[backend] = self._convert_message(node.message)
+            final_messages.extend(converted)
+        return final_messages
+
+    def get_budget_key(self) -> str:
+        return f"{self.budget_key or ''}:{self.vendor}/{self.model}"
+
+    def request_params(self) -> Dict[str, Any]:
+        """
+        model params for the next request; a missing or 0 max_tokens is sized from the prompt and previous outputs
+        """
+        params = dict(self.model_params)
+        if not params.get("max_tokens"):
+            with span("size_max_tokens"):
+                capabilities = self.model_capabilities(self.model)
+                params["max_tokens"] = size_max_tokens(
+                    estimate_conversation_tokens(self.conversation, self.vendor),
+                    capabilities["context_window"],
+                    capabilities["max_output_tokens"],
+                    observed_output_tokens(self.get_budget_key())
+                )
+            logger.debug("Sized max_tokens to {}", params["max_tokens"])
+        if self.tools:
+            params.update(self.tool_params())
+        return params
+
+    def add_output_tokens(self, tokens: int):
+        if tokens:
+            self.last_output_tokens += tokens
+
+    def record_output_tokens(self):
+        """
+        called at the end of a run, with all continuation rounds added up
+        """
+        if self.last_output_tokens:
+            record_output_tokens(self.get_budget_key(), self.last_output_tokens)
+
+    def clone(self, conversation: Conversation = None, stateful: bool = None):
+        """
+        returns a new LLM of the same vendor and model, with its own copy of the model params
+        and a fork of the conversation (unless one is given)
+        """
+        if conversation is None:
+            conversation = self.conversation.fork()
+        if stateful is None:
+            stateful = self.stateful
+        llm = type(self)(model=self.model, model_params=dict(self.model_params), conversation=conversation, stateful=stateful)
+        llm.budget_key = self.budget_key
+        llm.upload_images = self.upload_images
+        llm.tools = list(self.tools)
+        return llm
+
     """
     CONVERSATION HELPERS
     """
@@ -39,18 +293,24 @@ class BaseLLM:
     def add_message_to_conversation(self, message: Message):
         self.conversation.messages.append(message)
 
+    @staticmethod
+    def message_text(message: Message) -> str:
+        if isinstance(message.content, str):
+            return message.content
+        return "".join(item.text for item in message.content if item.type == "text")
+
     def get_latest_assistant_message(self, text=False):
         for message in reversed(self.conversation.messages):
             if message.role == "assistant":
                 if text:
-                    return message.content[0].text
+                    return self.message_text(message)
                 else:
                     return message
         return None
 
     def get_all_assistant_messages(self, text=False):
         if text:
-            return [message.content[0].text for message in self.conversation.messages if message.role == "assistant"]
+            return [self.message_text(message) for message in self.conversation.messages if message.role == "assistant"]
         else:
             return [message for message in self.conversation.messages if message.role == "assistant"]
 
@@ -67,7 +327,7 @@ class BaseLLM:
         # 1. find the last user message that's not until_completion_user_message
         last_user_message = None
         for message in self.conversation.messages:
-            if message.role == "user" and message.content[0].text != until_completion_user_message.content[0].text:
+            if message.role == "user" and self.message_text(message) != self.message_text(until_completion_user_message):
                 last_user_message = message
 
         # 2. remove all messages after the last user message that's not until_completion_user_message
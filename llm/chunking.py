@@ -0,0 +1,94 @@
+import re
+from typing import List, Tuple
+import numpy as np
+from .tokenizer import token_pieces
+
+
+def _windows(text: str, max_tokens: int, starts: np.ndarray, ends: np.ndarray, tokens: np.ndarray) -> List[Tuple[str, int]]:
+    # (window, tokens) of at most max_tokens (estimated) tokens each, cut between the token_pieces of text
+    if len(tokens) and tokens.max() > max_tokens:
+        # pieces longer than a window, e.g. base64 blobs, are cut into pieces that fit first
+        size = max(max_tokens - 1, 1) * 6
+        cuts = [(cut, min(cut + size, end)) for start, end in zip(starts.tolist(), ends.tolist()) for cut in range(start, end, size)]
+        starts = np.array([cut[0] for cut in cuts])
+        ends = np.array([cut[1] for cut in cuts])
+        tokens = 1 + (ends - starts) // 6
+
+    cumulative = np.cumsum(tokens)
+    windows = []
+    i = 0
+    base = 0
+    while i < len(tokens):
+        # first piece past the budget, at least one piece per window
+        j = max(int(np.searchsorted(cumulative, base + max_tokens, side="right")), i + 1)
+        windows.append((text[starts[i]:ends[j - 1]], int(cumulative[j - 1] - base)))
+        base = cumulative[j - 1]
+        i = j
+    return windows
+
+
+def _last_tokens(text: str, max_tokens: int) -> str:
+    # the longest suffix of text estimated at no more than max_tokens tokens
+    # only looks at a tail of text, the first piece of the tail may be cut so it doesn't count
+    size = 8 * (max_tokens + 1)
+    while True:
+        offset = max(len(text) - size, 0)
+        starts, _, tokens = token_pieces(text[offset:])
+        if offset:
+            starts, tokens = starts[1:], tokens[1:]
+        suffix_tokens = np.cumsum(tokens[::-1])
+        if not offset or (len(suffix_tokens) and suffix_tokens[-1] > max_tokens):
+            break
+        size *= 2
+    fitting = int(np.searchsorted(suffix_tokens, max_tokens, side="right"))
+    return text[offset + starts[len(starts) - fitting]:] if fitting else ""
+
+
+def split_text(text: str, chunk_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """
+    Splits text into chunks of at most chunk_tokens (estimated) tokens.
+
+    Paragraphs are packed greedily so chunks break on paragraph boundaries where possible,
+    paragraphs longer than a chunk are split into windows.
+    Each chunk after the first is prefixed with the last overlap_tokens of the previous chunk.
+    """
+    if chunk_tokens < 1:
+        raise ValueError("chunk_tokens must be at least 1")
+    if overlap_tokens >= chunk_tokens:
+        raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+
+    text = text.strip()
+    if not text:
+        return []
+
+    body_tokens = chunk_tokens - overlap_tokens
+
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        starts, ends, tokens = token_pieces(paragraph)
+        total = int(tokens.sum())
+        if total <= body_tokens:
+            pieces.append((paragraph, total))
+        else:
+            pieces.extend(_windows(paragraph, body_tokens, starts, ends, tokens))
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece, tokens in pieces:
+        if current and current_tokens + tokens > body_tokens:
+            chunks.append("\n\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+
+    if overlap_tokens:
+        overlaps = [_last_tokens(chunk, overlap_tokens) for chunk in chunks[:-1]]
+        chunks = [chunks[0]] + [f"{overlap}\n\n{chunk}" if overlap else chunk for overlap, chunk in zip(overlaps, chunks[1:])]
+    return chunks
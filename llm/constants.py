@@ -11,8 +11,17 @@ SUPPORTED_MODELS = {
     ]
 }
 
-def flat_vendor_models():
-    """
-    Returns a list of all models supported by the LLM nodes, in the format "vendor/model".
-    """
-    return [f"{vendor}/{model}" for vendor, models in SUPPORTED_MODELS.items() for model in models]
+# context_window: prompt + output tokens, max_output_tokens: largest allowed max_tokens
+MODEL_CAPABILITIES = {
+    "gpt-4o": {"context_window": 128000, "max_output_tokens": 16384},
+    "gpt-4o-mini": {"context_window": 128000, "max_output_tokens": 16384},
+    "gpt-4-vision-preview": {"context_window": 128000, "max_output_tokens": 4096},
+    # 8192 only with the max-tokens-3-5-sonnet-2024-07-15 beta header
+    "claude-3-5-sonnet-20240620": {"context_window": 200000, "max_output_tokens": 4096},
+    "claude-3-opus-20240229": {"context_window": 200000, "max_output_tokens": 4096},
+    "claude-3-haiku-20240307": {"context_window": 200000, "max_output_tokens": 4096},
+}
+
+# defaults for models we know nothing about, e.g. ones served by self-hosted servers; their context window is
+# left to the server (None) rather than guessed, set "capabilities" when registering the server to bound it
+DEFAULT_MODEL_CAPABILITIES = {"context_window": None, "max_output_tokens": 4096}
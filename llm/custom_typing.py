@@ -1,5 +1,6 @@
-from typing import List, Union, Literal
-from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional, Union, Literal
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, field_serializer, field_validator
+from .message_chain import MessageChain
 
 class ImageSource(BaseModel):
     type: Literal["base64"] = "base64"
@@ -14,17 +15,31 @@ class TextContent(BaseModel):
     type: Literal["text"] = "text"
     text: str
 
+class ToolUseContent(BaseModel):
+    type: Literal["tool_use"] = "tool_use"
+    id: str
+    name: str
+    input: Dict[str, Any]
+    # the model's arguments if they weren't a JSON object; the call is answered with an error instead of run
+    invalid_input: Optional[str] = None
+
+class ToolResultContent(BaseModel):
+    type: Literal["tool_result"] = "tool_result"
+    tool_use_id: str
+    content: str
+    is_error: bool = False
+
 class SystemMessage(BaseModel):
     role: Literal["system"] = "system"
     content: str
 
 class UserMessage(BaseModel):
     role: Literal["user"] = "user"
-    content: List[Union[TextContent, ImageContent]]
+    content: List[Union[TextContent, ImageContent, ToolResultContent]]
 
 class AssistantMessage(BaseModel):
     role: Literal["assistant"] = "assistant"
-    content: List[Union[TextContent, ImageContent]]
+    content: List[Union[TextContent, ImageContent, ToolUseContent]]
     finish_reason: str
 
 
@@ -57,5 +72,29 @@ class Conversation(BaseModel):
         },
         {"role": "assistant", "content": "<str>"},
     ]
+
+    messages is a MessageChain: forks share their common prefix instead of copying it.
     """
-    messages: List[Message]
+    model_config = ConfigDict(arbitrary_types_allowed=True, validate_assignment=True)
+
+    messages: MessageChain
+
+    @field_validator("messages", mode="before")
+    @classmethod
+    def _to_chain(cls, messages):
+        if isinstance(messages, MessageChain):
+            return messages
+        return MessageChain(_MESSAGES_ADAPTER.validate_python(messages))
+
+    @field_serializer("messages")
+    def _serialize_messages(self, messages: MessageChain):
+        return [message.model_dump() for message in messages]
+
+    def fork(self) -> "Conversation":
+        """
+        an independent conversation sharing this one's messages, O(1)
+        """
+        return Conversation(messages=self.messages.fork())
+
+
+_MESSAGES_ADAPTER = TypeAdapter(List[Message])
@@ -0,0 +1,52 @@
+from typing import List, Tuple
+import numpy as np
+from .tokenizer import estimate_text_tokens
+from .tracing import span
+from .vector_store import VectorStore, text_hash
+
+
+def embedding_batches(texts: List[str], max_inputs: int, max_tokens: int) -> List[List[str]]:
+    """
+    consecutive batches of at most max_inputs texts and max_tokens (estimated) tokens
+    """
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for text in texts:
+        tokens = estimate_text_tokens(text)
+        if batch and (len(batch) >= max_inputs or batch_tokens + tokens > max_tokens):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def embed_cached(backend: type, texts: List[str], store: VectorStore, model: str = None, max_concurrency: int = 4) -> np.ndarray:
+    """
+    embeddings of texts, only embedding texts whose content hash isn't in the store yet
+    """
+    keys = [text_hash(text) for text in texts]
+    missing = {key: text for key, text in zip(keys, texts) if key not in store}
+    if missing:
+        store.add(list(missing), backend.embed(list(missing.values()), model=model, max_concurrency=max_concurrency))
+    return store.get(keys)
+
+
+def top_k_similar(query: np.ndarray, vectors: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+    """
+    (row, cosine similarity) of the top_k rows of vectors most similar to query, best first
+    """
+    with span("similarity_search", vectors=len(vectors)):
+        if len(vectors) == 0:
+            return []
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+        similarities = (vectors @ query) / np.where(norms == 0, 1, norms)
+        top = np.arange(len(vectors))
+        if len(vectors) > top_k:
+            top = np.argpartition(-similarities, top_k - 1)[:top_k]
+        top = top[np.lexsort((top, -similarities[top]))]
+        return [(int(i), float(similarities[i])) for i in top]
@@ -0,0 +1,24 @@
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    process wide pool for LLM calls that run in the background of a ComfyUI execution
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("COMFYUI_LLM_MAX_WORKERS", 16)),
+                thread_name_prefix="comfyui-llm"
+            )
+        return _executor
+
+
+def submit(fn, *args, **kwargs) -> Future:
+    return get_executor().submit(fn, *args, **kwargs)
@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Callable, List, Optional, Tuple
+from jinja2 import Template
+from loguru import logger
+from pydantic import BaseModel
+from .base_llm import BaseLLM
+from .custom_typing import Conversation, SystemMessage, UserMessage
+from .tracing import span
+
+DEFAULT_MAP_PROMPT = "Extract all information relevant to the task from this part of the document.\n\n{{ chunk }}"
+DEFAULT_REDUCE_PROMPT = (
+    "Combine the following partial results into a single, coherent answer.\n\n"
+    "{% for partial in partials %}--- Part {{ loop.index }} ---\n{{ partial }}\n\n{% endfor %}"
+)
+
+
+class Chunk(BaseModel):
+    text: str = ""
+    # base64 encoded jpegs
+    images: List[str] = []
+
+
+def count_reduce_calls(num_partials: int, fan_in: int) -> int:
+    calls = 0
+    while num_partials > 1:
+        # a trailing group of one is passed through without a call
+        calls += num_partials // fan_in + (1 if num_partials % fan_in > 1 else 0)
+        num_partials = (num_partials + fan_in - 1) // fan_in
+    return calls
+
+
+class MapReduce:
+    """
+    Runs a map prompt over every chunk concurrently, then reduces the partial results
+    hierarchically (fan_in partials per reduce call) until a single result is left.
+
+    Every map/reduce call runs on a stateless clone of the given LLM, so the LLM itself is left untouched.
+    """
+    def __init__(
+        self,
+        llm: BaseLLM,
+        map_prompt: str = DEFAULT_MAP_PROMPT,
+        reduce_prompt: str = DEFAULT_REDUCE_PROMPT,
+        system_prompt: str = "",
+        max_concurrency: int = 4,
+        fan_in: int = 4,
+        on_progress: Optional[Callable[[int, int], None]] = None
+    ):
+        if fan_in < 2:
+            raise ValueError("fan_in must be at least 2")
+        self.llm = llm
+        self.map_template = Template(map_prompt)
+        self.reduce_template = Template(reduce_prompt)
+        self.system_prompt = system_prompt
+        self.max_concurrency = max(1, max_concurrency)
+        self.fan_in = fan_in
+        self.on_progress = on_progress
+
+        self._chunks = []
+        self._progress_lock = Lock()
+        self._done = 0
+        self._total = 0
+
+    def _complete(self, user_message: UserMessage) -> str:
+        conversation = Conversation(messages=[SystemMessage(content=self.system_prompt), user_message])
+        output_text = self.llm.clone(conversation=conversation, stateful=False).run()
+        with self._progress_lock:
+            self._done += 1
+            if self.on_progress:
+                self.on_progress(self._done, self._total)
+        return output_text
+
+    def _map_one(self, args: Tuple[int, Chunk]) -> str:
+        index, chunk = args
+        prompt = self.map_template.render(chunk=chunk.text, index=index + 1, total=len(self._chunks))
+        return self._complete(UserMessage(content=[
+            *[{"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": image}} for image in chunk.images],
+            {"type": "text", "text": prompt},
+        ]))
+
+    def _reduce_one(self, partials: List[str]) -> str:
+        if len(partials) == 1:
+            return partials[0]
+        prompt = self.reduce_template.render(partials=partials)
+        return self._complete(UserMessage(content=[{"type": "text", "text": prompt}]))
+
+    def run(self, chunks: List[Chunk]) -> Tuple[str, List[str]]:
+        """
+        returns the final result and the map outputs, in chunk order
+        """
+        if not chunks:
+            raise ValueError("Nothing to map over, provide text or images")
+
+        self._chunks = chunks
+        self._done = 0
+        self._total = len(chunks) + count_reduce_calls(len(chunks), self.fan_in)
+        logger.info("Map-reduce over {} chunks with {} total calls", len(chunks), self._total)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            with span("map", num_chunks=len(chunks)):
+                partials = list(executor.map(self._map_one, enumerate(chunks)))
+
+            level = partials
+            depth = 0
+            while len(level) > 1:
+                depth += 1
+                groups = [level[i:i + self.fan_in] for i in range(0, len(level), self.fan_in)]
+                logger.debug("Reduce level {}: {} partials into {} groups", depth, len(level), len(groups))
+                with span("reduce", level=depth, num_groups=len(groups)):
+                    level = list(executor.map(self._reduce_one, groups))
+
+        return level[0], partials
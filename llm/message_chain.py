@@ -0,0 +1,127 @@
+from collections.abc import MutableSequence
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+
+class MessageNode:
+    """
+    One message of a conversation and a link to the messages before it. Nodes are never modified once created,
+    so any number of conversations can share them as their prefix.
+
+    conversions caches the message in each vendor's format, keyed by backend class.
+    """
+    __slots__ = ("message", "parent", "length", "conversions")
+
+    def __init__(self, message: Any, parent: Optional["MessageNode"]):
+        self.message = message
+        self.parent = parent
+        self.length = parent.length + 1 if parent is not None else 1
+        self.conversions: Dict[type, List[Dict[str, Any]]] = {}
+
+
+class MessageChain(MutableSequence):
+    """
+    Persistent list of messages: a pointer to the last MessageNode.
+
+    fork() and prefix slices ([:n]) are O(1) / O(len - n) and share the nodes of the prefix; appending to one
+    fork never affects another. Everything else behaves like a list, modifications before the end rebuild the nodes
+    after the modified position.
+    """
+    __slots__ = ("_tail",)
+
+    def __init__(self, messages: Iterable[Any] = (), tail: Optional[MessageNode] = None):
+        self._tail = tail
+        for message in messages:
+            self._tail = MessageNode(message, self._tail)
+
+    def fork(self) -> "MessageChain":
+        return MessageChain(tail=self._tail)
+
+    def nodes(self) -> List[MessageNode]:
+        """
+        nodes from the first message to the last
+        """
+        nodes = []
+        node = self._tail
+        while node is not None:
+            nodes.append(node)
+            node = node.parent
+        nodes.reverse()
+        return nodes
+
+    def _node_at(self, length: int) -> Optional[MessageNode]:
+        # the node ending the prefix of the given length
+        node = self._tail
+        while node is not None and node.length > length:
+            node = node.parent
+        return node
+
+    def __len__(self) -> int:
+        return self._tail.length if self._tail is not None else 0
+
+    def __iter__(self) -> Iterator[Any]:
+        return (node.message for node in self.nodes())
+
+    def __reversed__(self) -> Iterator[Any]:
+        node = self._tail
+        while node is not None:
+            yield node.message
+            node = node.parent
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if start == 0 and step == 1:
+                return MessageChain(tail=self._node_at(max(stop, 0)))
+            return MessageChain(list(self)[index])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("MessageChain index out of range")
+        return self._node_at(index + 1).message
+
+    def _rebuild(self, messages: List[Any], keep: int):
+        # keeps the first `keep` nodes and appends messages[keep:] as new nodes
+        self._tail = self._node_at(keep) if keep > 0 else None
+        for message in messages[keep:]:
+            self._tail = MessageNode(message, self._tail)
+
+    def _first_index(self, index) -> int:
+        # first position a list operation on index modifies
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                # also where an empty slice inserts
+                return start
+            return min(range(start, stop, step), default=len(self))
+        return index + len(self) if index < 0 else index
+
+    def __setitem__(self, index, value):
+        messages = list(self)
+        messages[index] = value
+        self._rebuild(messages, self._first_index(index))
+
+    def __delitem__(self, index):
+        messages = list(self)
+        del messages[index]
+        self._rebuild(messages, min(self._first_index(index), len(messages)))
+
+    def insert(self, index: int, value: Any):
+        messages = list(self)
+        messages.insert(index, value)
+        self._rebuild(messages, min(max(self._first_index(index), 0), len(self)))
+
+    def append(self, value: Any):
+        self._tail = MessageNode(value, self._tail)
+
+    def clear(self):
+        self._tail = None
+
+    def __eq__(self, other):
+        if isinstance(other, MessageChain) and other._tail is self._tail:
+            return True
+        if isinstance(other, (MessageChain, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"MessageChain({list(self)!r})"
@@ -1,27 +1,62 @@
-import os
-from typing import Dict
-from openai import OpenAI
+import json
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+from openai import OpenAI, APIConnectionError
+import numpy as np
 from loguru import logger
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
 from .constants import SUPPORTED_MODELS
-from .custom_typing import Conversation, UserMessage, AssistantMessage
+from .custom_typing import Conversation, Message, UserMessage, AssistantMessage
 from .base_llm import BaseLLM
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+from .pool import EndpointPool
+from .token_budget import ContextWindowExceeded
+from .tracing import span, trace_retry
 
 class BaseOpenAI(BaseLLM):
     VENDOR = "openai"
     ALLOWED_MODELS = SUPPORTED_MODELS[VENDOR]
+    API_KEY_ENV = "OPENAI_API_KEY"
+    BASE_URL = None
+    EMBEDDING_MODEL = "text-embedding-3-small"
 
-    def __init__(self, model: str, model_params: Dict[str, str] = {}, conversation: Conversation = Conversation(messages=[]), stateful: bool = True):
-        logger.info(f"Initializing OpenAI with model: {model}, stateful: {stateful}")
-        if model not in self.ALLOWED_MODELS:
-            raise ValueError(f"Model {model} is not supported")
+    def __init__(self, model: str, model_params: Dict[str, str] = None, conversation: Conversation = None, stateful: bool = True):
+        logger.info("Initializing OpenAI with model: {}, stateful: {}", model, stateful)
+        self.validate_model(model)
         super().__init__(self.VENDOR, model, model_params, conversation, stateful)
 
-    def __convert_conversation_to_messages(self, conversation: Conversation):
-        logger.debug("Converting conversation to OpenAI message format")
+    @classmethod
+    def default_endpoints(cls) -> List[Dict[str, Any]]:
+        return [{"api_key_env": cls.API_KEY_ENV, "base_url": cls.BASE_URL}]
+
+    @classmethod
+    def get_pool(cls) -> EndpointPool:
+        # created on first use, one pool per backend class, with a client (and connection pool) per endpoint
+        with cls._class_lock:
+            if cls.__dict__.get("_pool") is None:
+                cls._pool = EndpointPool.from_config(cls.VENDOR, OpenAI, cls.default_endpoints(), connection_errors=(APIConnectionError,))
+            return cls._pool
+
+    @classmethod
+    def get_client(cls) -> OpenAI:
+        return cls.get_pool().select().client
+
+    @classmethod
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), before_sleep=trace_retry)
+    def _embed_batch(cls, texts: List[str], model: str) -> np.ndarray:
+        with span("embed_batch", vendor=cls.VENDOR, model=model, texts=len(texts)):
+            response = cls.get_pool().request(lambda endpoint: endpoint.client.embeddings.with_raw_response.create(
+                model=model,
+                input=texts,
+                encoding_format="base64"
+            ))
+        # servers that ignore encoding_format return lists of floats
+        return np.stack([
+            np.frombuffer(base64.b64decode(item.embedding), dtype=np.float32) if isinstance(item.embedding, str) else np.asarray(item.embedding, dtype=np.float32)
+            for item in sorted(response.data, key=lambda item: item.index)
+        ])
+
+    def _convert_message(self, message: Message):
         """
         convert this format of conversation:
         data structure for a conversation:
@@ -58,62 +93,138 @@ class BaseOpenAI(BaseLLM):
                     {"type": "text", "text": user_prompt},
                 ]}
             ]
+
+        tool calls (in assistant messages) and tool results (in user messages) become "tool_calls" and "tool" role messages
         """
-        final_messages = []
-        for message in conversation.messages:
-            if message.role == "system":
-                final_messages.append({"role": "system", "content": message.content})
-            elif message.role == "user":
-                user_content = []
-                for content_item in message.content:
-                    if content_item.type == "text":
-                        user_content.append({"type": "text", "text": content_item.text})
-                    elif content_item.type == "image":
-                        user_content.append({
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{content_item.source.media_type};{content_item.source.type},{content_item.source.data}"
-                            }
-                        })
-                final_messages.append({"role": "user", "content": user_content})
-            elif message.role == "assistant":
-                final_messages.append({"role": "assistant", "content": message.content})
-        logger.debug(f"Converted {len(conversation.messages)} messages to OpenAI format")
-        return final_messages
-
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    def _run_messages(self):
+        if message.role == "system":
+            return [{"role": "system", "content": message.content}]
+        elif message.role == "user":
+            tool_messages = []
+            user_content = []
+            for content_item in message.content:
+                if content_item.type == "text":
+                    user_content.append({"type": "text", "text": content_item.text})
+                elif content_item.type == "image":
+                    user_content.append({
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{content_item.source.media_type};{content_item.source.type},{content_item.source.data}"
+                        }
+                    })
+                elif content_item.type == "tool_result":
+                    # tool results have to directly follow the assistant message that called the tools
+                    tool_messages.append({"role": "tool", "tool_call_id": content_item.tool_use_id, "content": content_item.content})
+            return tool_messages + ([{"role": "user", "content": user_content}] if user_content else [])
+        elif message.role == "assistant":
+            assistant_message = {"role": "assistant", "content": self.message_text(message) or None}
+            tool_calls = [
+                {"id": item.id, "type": "function", "function": {"name": item.name, "arguments": item.invalid_input if item.invalid_input is not None else json.dumps(item.input)}}
+                for item in message.content if item.type == "tool_use"
+            ]
+            if tool_calls:
+                assistant_message["tool_calls"] = tool_calls
+            return [assistant_message]
+        return []
+
+    def _parse_assistant_message(self, choice) -> AssistantMessage:
+        content = []
+        if choice.message.content:
+            content.append({"type": "text", "text": choice.message.content})
+        for tool_call in choice.message.tool_calls or []:
+            arguments = tool_call.function.arguments or "{}"
+            try:
+                tool_input = json.loads(arguments)
+            except ValueError:
+                tool_input = None
+            if isinstance(tool_input, dict):
+                content.append({"type": "tool_use", "id": tool_call.id, "name": tool_call.function.name, "input": tool_input})
+            else:
+                # not retried: the model is told its arguments were invalid and can call the tool again
+                logger.warning("Tool call {} has invalid arguments: {}", tool_call.function.name, arguments)
+                content.append({"type": "tool_use", "id": tool_call.id, "name": tool_call.function.name, "input": {}, "invalid_input": arguments})
+        if not content:
+            content.append({"type": "text", "text": ""})
+        return AssistantMessage(content=content, finish_reason=choice.finish_reason)
+
+    def tool_params(self):
+        return {"tools": [
+            {"type": "function", "function": {"name": tool.name, "description": tool.description, "parameters": tool.parameters}}
+            for tool in self.tools
+        ]}
+
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), retry=retry_if_not_exception_type(ContextWindowExceeded), before_sleep=trace_retry)
+    def _run_messages(self, record: bool = None):
         logger.info("Running messages through OpenAI API")
-        messages = self.__convert_conversation_to_messages(self.conversation)
+        with span("convert_messages", vendor=self.VENDOR, num_messages=len(self.conversation.messages)):
+            messages = self.convert_conversation()
         try:
-            response = openai_client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                **self.model_params
-            )
+            params = self.request_params()
+            with span("api_call", vendor=self.VENDOR, model=self.model):
+                response = self.get_pool().request(lambda endpoint: endpoint.client.chat.completions.with_raw_response.create(
+                    model=self.model,
+                    messages=messages,
+                    **params
+                ))
             logger.debug("Successfully received response from OpenAI API")
-            output_text = response.choices[0].message.content
+            if response.usage:
+                self.add_output_tokens(response.usage.completion_tokens)
+            with span("build_assistant_message"):
+                assistant_message = self._parse_assistant_message(response.choices[0])
+            output_text = self.message_text(assistant_message)
 
-            if self.stateful:
-                assistant_message = AssistantMessage(content=[{"type": "text", "text": output_text}], finish_reason=response.choices[0].finish_reason)
+            if self.stateful if record is None else record:
                 self.add_message_to_conversation(assistant_message)
                 logger.debug("Added assistant message to conversation")
             return output_text, response
         except Exception as e:
-            logger.error(f"Error occurred while running messages: {str(e)}")
+            logger.error("Error occurred while running messages: {}", e)
             raise
 
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), retry=retry_if_not_exception_type(ContextWindowExceeded), before_sleep=trace_retry)
+    def _sample_messages(self, n: int) -> List[AssistantMessage]:
+        with span("convert_messages", vendor=self.VENDOR, num_messages=len(self.conversation.messages)):
+            messages = self.convert_conversation()
+        params = self.request_params()
+
+        def create(count):
+            return self.get_pool().request(lambda endpoint: endpoint.client.chat.completions.with_raw_response.create(
+                model=self.model,
+                messages=messages,
+                n=count,
+                **params
+            ))
+
+        # one request for all samples, the prompt is sent (and billed) once
+        with span("api_call", vendor=self.VENDOR, model=self.model, n=n):
+            responses = [create(n)]
+        missing = n - len(responses[0].choices)
+        if missing > 0:
+            # some OpenAI compatible servers ignore n
+            logger.warning("Received {} of {} samples, requesting the rest separately", n - missing, n)
+            with ThreadPoolExecutor(max_workers=missing) as executor:
+                responses.extend(executor.map(lambda _: create(1), range(missing)))
+
+        candidates = []
+        for response in responses:
+            if response.usage:
+                self.add_output_tokens(response.usage.completion_tokens)
+            candidates.extend(self._parse_assistant_message(choice) for choice in sorted(response.choices, key=lambda choice: choice.index))
+        return candidates[:n]
+
     def _run_messages_until_completion(self, until_completion_user_message: UserMessage):
         logger.info("Running messages until completion")
         assert self.stateful, "stateful must be True to run until completion"
 
         full_output_text = []
+        round_number = 0
         while True:
-            logger.debug("Running model iteration")
-            output_text, response = self._run_messages()
+            round_number += 1
+            logger.debug("Running model iteration {}", round_number)
+            with span("continuation_round", round=round_number):
+                output_text, response = self._run_messages()
             full_output_text.append(output_text)
             finish_reason = response.choices[0].finish_reason
-            logger.debug(f"Response: {response}")
+            logger.debug("Response: {}", response)
             
             if finish_reason in ["stop_sequence", "stop"]:
                 logger.info("Model generated a stop sequence")
@@ -125,14 +236,14 @@ class BaseOpenAI(BaseLLM):
             elif finish_reason == "content_filter":
                 logger.error("Model generated content that violates the content policy")
                 raise RuntimeError("Content filter violation")
-            elif finish_reason == "function_call":
-                logger.error("Model called a function, which is not supported yet")
-                raise NotImplementedError("Function calling is not supported yet")
+            elif finish_reason in ["function_call", "tool_calls"]:
+                logger.error("Model called a function, but no tools were added to the LLM")
+                raise NotImplementedError("Function calling requires tools, add them with add_tool")
             elif finish_reason in ["null", None]:
                 logger.error("Model did not generate any content")
                 raise RuntimeError("Model did not generate any content")
             else:
-                logger.warning(f"Unknown finish reason: {finish_reason}")
+                logger.warning("Unknown finish reason: {}", finish_reason)
                 return "".join(full_output_text)
 
     def run(
@@ -141,15 +252,22 @@ class BaseOpenAI(BaseLLM):
         until_completion_user_message: UserMessage = None,
         cleanup_completion: bool = True
     ):
-        logger.info(f"Running OpenAI with until_completion: {until_completion}")
-        if until_completion:
+        logger.info("Running OpenAI with until_completion: {}", until_completion)
+        self.last_output_tokens = 0
+        if self.tools:
+            with span("run_agent", vendor=self.VENDOR, model=self.model):
+                output_text = self.run_agent()
+        elif until_completion:
             if not until_completion_user_message:
                 until_completion_user_message = self.default_until_completion_user_message
-            output_text = self._run_messages_until_completion(until_completion_user_message)
-            if cleanup_completion:
-                self.cleanup_completion(output_text, until_completion_user_message)
+            with span("run_until_completion", vendor=self.VENDOR, model=self.model):
+                output_text = self._run_messages_until_completion(until_completion_user_message)
+                if cleanup_completion:
+                    self.cleanup_completion(output_text, until_completion_user_message)
         else:
-            output_text, response = self._run_messages()
+            with span("run", vendor=self.VENDOR, model=self.model):
+                output_text, response = self._run_messages()
 
+        self.record_output_tokens()
         logger.info("Completed running OpenAI")
         return output_text
@@ -0,0 +1,59 @@
+import os
+from typing import Any, Dict, List
+from loguru import logger
+from .openai import BaseOpenAI
+
+
+class BaseOpenAICompatible(BaseOpenAI):
+    """
+    Any server implementing the OpenAI chat completions API (vLLM, llama.cpp server, ...).
+    Subclasses are created per server with make_openai_compatible_backend.
+    """
+    VENDOR = None
+    ALLOWED_MODELS = []
+    API_KEY_ENV = None
+    API_KEY = None
+    BASE_URL = None
+    # servers name their embedding models freely, so there is no default
+    EMBEDDING_MODEL = None
+
+    @classmethod
+    def default_endpoints(cls) -> List[Dict[str, Any]]:
+        # local servers usually accept any key, but the client requires one
+        api_key = cls.API_KEY or (os.getenv(cls.API_KEY_ENV) if cls.API_KEY_ENV else None) or "EMPTY"
+        return [{"api_key": api_key, "base_url": cls.BASE_URL}]
+
+    @classmethod
+    def list_models(cls) -> List[str]:
+        if cls.ALLOWED_MODELS:
+            return list(cls.ALLOWED_MODELS)
+        logger.info("Discovering models served at {}", cls.BASE_URL)
+        client = cls.get_client().with_options(timeout=cls.MODEL_LIST_TIMEOUT, max_retries=0)
+        return [model.id for model in client.models.list()]
+
+
+def make_openai_compatible_backend(
+    vendor: str,
+    base_url: str,
+    api_key: str = None,
+    api_key_env: str = None,
+    models: List[str] = None,
+    capabilities: Dict[str, Dict[str, int]] = None,
+    embedding_model: str = None
+) -> type:
+    """
+    creates the backend class for one OpenAI compatible server, models are discovered from the server if not given
+    """
+    return type(
+        f"OpenAICompatible_{vendor}",
+        (BaseOpenAICompatible,),
+        {
+            "VENDOR": vendor,
+            "BASE_URL": base_url,
+            "API_KEY": api_key,
+            "API_KEY_ENV": api_key_env,
+            "ALLOWED_MODELS": list(models or []),
+            "CAPABILITIES": dict(capabilities or {}),
+            "EMBEDDING_MODEL": embedding_model,
+        }
+    )
@@ -0,0 +1,208 @@
+import os
+import json
+import time
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from loguru import logger
+from .tracing import span, instant
+
+# vendor overload (Anthropic) is treated like a server error
+RETRYABLE_STATUS_CODES = {500, 502, 503, 504, 529}
+RATE_LIMIT_STATUS_CODE = 429
+
+
+class Endpoint:
+    """
+    One API key + base URL. Tracks requests in flight, the rate limit headroom reported in response headers,
+    and consecutive failures for the circuit breaker.
+    """
+    def __init__(self, name: str, client_factory: Callable[..., Any], api_key: str = None, base_url: str = None, weight: float = 1.0, max_retries: int = 2):
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.weight = weight
+        self._client_factory = client_factory
+        self._max_retries = max_retries
+        self._client = None
+        # the pool's lock once the endpoint is in a pool
+        self._lock = Lock()
+
+        self.outstanding = 0
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.throttled_until = 0.0
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                # concurrent first requests share one client (and its connection pool)
+                if self._client is None:
+                    self._client = self._client_factory(api_key=self.api_key, base_url=self.base_url, max_retries=self._max_retries)
+        return self._client
+
+    def available(self, now: float) -> bool:
+        return now >= self.open_until and now >= self.throttled_until
+
+    def observe_headers(self, headers):
+        for header in ("x-ratelimit-remaining-requests", "anthropic-ratelimit-requests-remaining"):
+            if headers.get(header) is not None:
+                self.remaining_requests = int(headers[header])
+        for header in ("x-ratelimit-remaining-tokens", "anthropic-ratelimit-tokens-remaining"):
+            if headers.get(header) is not None:
+                self.remaining_tokens = int(headers[header])
+
+
+class EndpointPool:
+    """
+    Balances requests of one vendor over several endpoints and fails over to the next endpoint on
+    connection errors, 5xx/529 and rate limits.
+
+    strategy "least_outstanding" picks the endpoint with the fewest requests in flight (relative to its weight),
+    "headroom" the one with the most remaining requests in its rate limit window.
+    An endpoint failing failure_threshold times in a row is skipped for cooldown_seconds (circuit breaker),
+    a rate limited one until its retry-after has passed.
+    """
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        strategy: str = "least_outstanding",
+        failure_threshold: int = 3,
+        cooldown_seconds: float = 30.0,
+        connection_errors: Tuple[type, ...] = (ConnectionError, TimeoutError)
+    ):
+        if not endpoints:
+            raise ValueError("An endpoint pool needs at least one endpoint")
+        if strategy not in ("least_outstanding", "headroom"):
+            raise ValueError(f"Unknown strategy: {strategy}")
+        self.endpoints = endpoints
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.connection_errors = connection_errors
+        self._lock = Lock()
+        for endpoint in endpoints:
+            endpoint._lock = self._lock
+
+    @classmethod
+    def from_config(cls, vendor: str, client_factory: Callable[..., Any], default_endpoints: List[Dict[str, Any]], connection_errors: Tuple[type, ...] = ()):
+        """
+        endpoints of the vendor in the COMFYUI_LLM_ENDPOINTS_FILE JSON file, default_endpoints if it has none:
+        {
+            "openai": {
+                "strategy": "headroom",
+                "endpoints": [
+                    {"api_key_env": "OPENAI_API_KEY"},
+                    {"api_key_env": "OPENAI_API_KEY_2", "base_url": "https://eu.api.openai.com/v1", "weight": 2}
+                ]
+            }
+        }
+        """
+        config = {}
+        path = os.getenv("COMFYUI_LLM_ENDPOINTS_FILE")
+        if path:
+            with open(path) as f:
+                config = json.load(f).get(vendor, {})
+
+        endpoint_configs = config.get("endpoints") or default_endpoints
+        # with somewhere to fail over to, fail over instead of letting the client retry the same endpoint
+        max_retries = 0 if len(endpoint_configs) > 1 else 2
+        endpoints = [
+            Endpoint(
+                name=endpoint.get("name", f"{vendor}-{i}"),
+                client_factory=client_factory,
+                api_key=endpoint.get("api_key") or (os.getenv(endpoint["api_key_env"]) if endpoint.get("api_key_env") else None),
+                base_url=endpoint.get("base_url"),
+                weight=endpoint.get("weight", 1.0),
+                max_retries=max_retries
+            )
+            for i, endpoint in enumerate(endpoint_configs)
+        ]
+        return cls(
+            endpoints,
+            strategy=config.get("strategy", "least_outstanding"),
+            failure_threshold=config.get("failure_threshold", 3),
+            cooldown_seconds=config.get("cooldown_seconds", 30.0),
+            connection_errors=(ConnectionError, TimeoutError) + tuple(connection_errors)
+        )
+
+    def _score(self, endpoint: Endpoint):
+        load = endpoint.outstanding / endpoint.weight
+        if self.strategy == "headroom":
+            # unknown headroom (no response yet) counts as plenty
+            headroom = endpoint.remaining_requests if endpoint.remaining_requests is not None else float("inf")
+            return (-headroom * endpoint.weight, load)
+        return (load, -(endpoint.remaining_requests or 0))
+
+    def select(self, exclude: List[Endpoint] = ()) -> Optional[Endpoint]:
+        now = time.monotonic()
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+        if not candidates:
+            return None
+        available = [endpoint for endpoint in candidates if endpoint.available(now)]
+        if not available:
+            # everything is down or throttled: try whichever comes back first rather than failing without a request
+            return min(candidates, key=lambda endpoint: max(endpoint.open_until, endpoint.throttled_until))
+        return min(available, key=self._score)
+
+    def _record_success(self, endpoint: Endpoint):
+        with self._lock:
+            endpoint.consecutive_failures = 0
+            endpoint.open_until = 0.0
+
+    def _record_failure(self, endpoint: Endpoint, error: Exception):
+        with self._lock:
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.failure_threshold:
+                endpoint.open_until = time.monotonic() + self.cooldown_seconds
+                logger.warning("Endpoint {} failed {} times in a row, skipping it for {}s", endpoint.name, endpoint.consecutive_failures, self.cooldown_seconds)
+                instant("circuit_open", endpoint=endpoint.name)
+
+    def _record_rate_limit(self, endpoint: Endpoint, error: Exception):
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            retry_after = float(retry_after)
+        except (TypeError, ValueError):
+            retry_after = 1.0
+        with self._lock:
+            endpoint.remaining_requests = 0
+            endpoint.throttled_until = time.monotonic() + retry_after
+
+    def request(self, fn: Callable[[Endpoint], Any]) -> Any:
+        """
+        calls fn with the selected endpoint, failing over to the other endpoints; each endpoint is tried at most once.
+        Raw responses (with .headers and .parse()) are parsed after their rate limit headers were recorded
+        """
+        tried = []
+        last_error = None
+        while True:
+            with self._lock:
+                endpoint = self.select(exclude=tried)
+                if endpoint is None:
+                    raise last_error
+                endpoint.outstanding += 1
+            tried.append(endpoint)
+            try:
+                with span("endpoint_request", endpoint=endpoint.name, attempt=len(tried)):
+                    result = fn(endpoint)
+                if hasattr(result, "headers") and hasattr(result, "parse"):
+                    endpoint.observe_headers(result.headers)
+                    result = result.parse()
+                self._record_success(endpoint)
+                return result
+            except Exception as e:
+                status_code = getattr(e, "status_code", None)
+                if status_code == RATE_LIMIT_STATUS_CODE:
+                    self._record_rate_limit(endpoint, e)
+                elif status_code in RETRYABLE_STATUS_CODES or isinstance(e, self.connection_errors):
+                    self._record_failure(endpoint, e)
+                else:
+                    raise
+                logger.warning("Request to endpoint {} failed, failing over: {}", endpoint.name, e)
+                last_error = e
+            finally:
+                with self._lock:
+                    endpoint.outstanding -= 1
@@ -0,0 +1,113 @@
+import os
+import json
+import importlib
+from typing import Callable, Dict, List, Union
+from loguru import logger
+
+# vendor name -> backend class, "module:attribute" path (relative to this package) or a zero argument loader
+_VENDORS: Dict[str, Union[type, str, Callable[[], type]]] = {}
+
+
+def register_vendor(vendor: str, backend: Union[type, str, Callable[[], type]]):
+    """
+    registers a backend for a vendor, string paths and loaders are only resolved when the vendor is first used
+    """
+    if vendor in _VENDORS:
+        logger.warning("Vendor {} is already registered, replacing it", vendor)
+    _VENDORS[vendor] = backend
+
+
+def get_vendor(vendor: str) -> type:
+    backend = _VENDORS.get(vendor)
+    if backend is None:
+        raise ValueError(f"Unknown vendor: {vendor}")
+    if not isinstance(backend, type):
+        if isinstance(backend, str):
+            module_name, attribute = backend.split(":")
+            backend = getattr(importlib.import_module(module_name, package=__package__), attribute)
+        else:
+            backend = backend()
+        _VENDORS[vendor] = backend
+    return backend
+
+
+def vendor_names() -> List[str]:
+    return list(_VENDORS)
+
+
+def list_models(vendor: str, refresh: bool = False) -> List[str]:
+    return get_vendor(vendor).available_models(refresh=refresh)
+
+
+def flat_vendor_models() -> List[str]:
+    """
+    Returns a list of all models of all registered vendors, in the format "vendor/model".
+    Vendors whose models can't be listed (e.g. a local server that is down) are skipped.
+    """
+    vendor_models = []
+    for vendor in vendor_names():
+        try:
+            vendor_models.extend(f"{vendor}/{model}" for model in list_models(vendor))
+        except Exception as e:
+            logger.warning("Could not list models of vendor {}: {}", vendor, e)
+    return vendor_models
+
+
+def register_openai_compatible(
+    vendor: str,
+    base_url: str,
+    api_key: str = None,
+    api_key_env: str = None,
+    models: List[str] = None,
+    capabilities: Dict[str, Dict[str, int]] = None,
+    embedding_model: str = None
+):
+    def load():
+        from .openai_compatible import make_openai_compatible_backend
+        return make_openai_compatible_backend(
+            vendor, base_url, api_key=api_key, api_key_env=api_key_env, models=models, capabilities=capabilities, embedding_model=embedding_model
+        )
+    register_vendor(vendor, load)
+
+
+def register_openai_compatible_from_config(path: str):
+    """
+    registers every server in a JSON file of the form:
+    {
+        "vllm": {
+            "base_url": "http://localhost:8000/v1",
+            "api_key_env": "VLLM_API_KEY",
+            "models": ["meta-llama/Llama-3.1-8B-Instruct"],
+            "capabilities": {"meta-llama/Llama-3.1-8B-Instruct": {"context_window": 131072, "max_output_tokens": 8192}},
+            "embedding_model": "BAAI/bge-m3"
+        },
+        "llamacpp": {"base_url": "http://localhost:8080/v1"}
+    }
+    """
+    with open(path) as f:
+        config = json.load(f)
+    for vendor, server in config.items():
+        register_openai_compatible(
+            vendor,
+            server["base_url"],
+            api_key=server.get("api_key"),
+            api_key_env=server.get("api_key_env"),
+            models=server.get("models"),
+            capabilities=server.get("capabilities"),
+            embedding_model=server.get("embedding_model")
+        )
+
+
+register_vendor("openai", ".openai:BaseOpenAI")
+register_vendor("anthropic", ".anthropic:BaseAnthropic")
+
+if os.getenv("OPENAI_COMPATIBLE_BASE_URL"):
+    register_openai_compatible(
+        os.getenv("OPENAI_COMPATIBLE_VENDOR", "local"),
+        os.getenv("OPENAI_COMPATIBLE_BASE_URL"),
+        api_key_env="OPENAI_COMPATIBLE_API_KEY",
+        models=[model for model in os.getenv("OPENAI_COMPATIBLE_MODELS", "").split(",") if model],
+        embedding_model=os.getenv("OPENAI_COMPATIBLE_EMBEDDING_MODEL")
+    )
+if os.getenv("COMFYUI_LLM_VENDORS_FILE"):
+    register_openai_compatible_from_config(os.getenv("COMFYUI_LLM_VENDORS_FILE"))
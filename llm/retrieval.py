@@ -0,0 +1,111 @@
+import os
+import re
+import hashlib
+from collections import OrderedDict
+from itertools import chain
+from threading import Lock
+from typing import List, Tuple
+import numpy as np
+from .chunking import split_text
+from .tracing import span
+
+# BM25 defaults from the literature
+K1 = 1.5
+B = 0.75
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+_indexes = OrderedDict()
+_indexes_lock = Lock()
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    In-memory BM25 index over a list of passages.
+
+    Postings are kept as NumPy arrays grouped by term (CSR layout: indptr per term, passage ids and
+    precomputed BM25 weights per posting), so a query costs one slice and one scatter-add per query term.
+    """
+    def __init__(self, passages: List[str], k1: float = K1, b: float = B):
+        self.passages = passages
+        self.vocabulary = {}
+        n = len(passages)
+
+        term_ids = []
+        lengths = np.zeros(n, dtype=np.int64)
+        for i, passage in enumerate(passages):
+            ids = [self.vocabulary.setdefault(token, len(self.vocabulary)) for token in tokenize(passage)]
+            term_ids.append(ids)
+            lengths[i] = len(ids)
+
+        terms = np.fromiter(chain.from_iterable(term_ids), dtype=np.int64, count=int(lengths.sum()))
+        docs = np.repeat(np.arange(n, dtype=np.int64), lengths)
+        # one posting per (term, passage) pair, sorted by term
+        keys, tf = np.unique(terms * max(n, 1) + docs, return_counts=True)
+        posting_terms = keys // max(n, 1)
+        self.posting_docs = keys % max(n, 1)
+
+        df = np.bincount(posting_terms, minlength=len(self.vocabulary))
+        self.indptr = np.concatenate([[0], np.cumsum(df)])
+        self.idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+
+        average_length = lengths.mean() if n and lengths.sum() else 1.0
+        norm = k1 * (1 - b + b * lengths / average_length)
+        self.posting_weights = self.idf[posting_terms] * tf * (k1 + 1) / (tf + norm[self.posting_docs])
+
+    def __len__(self):
+        return len(self.passages)
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.passages))
+        for token in set(tokenize(query)):
+            term = self.vocabulary.get(token)
+            if term is None:
+                continue
+            start, end = self.indptr[term], self.indptr[term + 1]
+            # passage ids are unique within a term's postings, so fancy indexing adds each weight once
+            scores[self.posting_docs[start:end]] += self.posting_weights[start:end]
+        return scores
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """
+        (passage index, score) of the top_k passages matching any query term, best first
+        """
+        with span("bm25_search", passages=len(self.passages)):
+            scores = self.scores(query)
+            matching = np.flatnonzero(scores > 0)
+            if len(matching) > top_k:
+                matching = matching[np.argpartition(-scores[matching], top_k - 1)[:top_k]]
+            # ties go to the earlier passage
+            ranked = matching[np.lexsort((matching, -scores[matching]))]
+            return [(int(i), float(scores[i])) for i in ranked]
+
+
+def get_index(text: str, chunk_tokens: int = 200, overlap_tokens: int = 20) -> BM25Index:
+    """
+    BM25 index of the passages of text, cached by document hash (COMFYUI_LLM_RETRIEVAL_CACHE_SIZE documents)
+    """
+    key = hashlib.sha256(f"{chunk_tokens}:{overlap_tokens}:{text}".encode("utf-8")).hexdigest()
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+
+    with span("bm25_index", chars=len(text)):
+        index = BM25Index(split_text(text, chunk_tokens, overlap_tokens))
+
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > int(os.getenv("COMFYUI_LLM_RETRIEVAL_CACHE_SIZE", 16)):
+            _indexes.popitem(last=False)
+    return index
+
+
+def retrieve(text: str, query: str, top_k: int = 5, chunk_tokens: int = 200, overlap_tokens: int = 20) -> List[str]:
+    index = get_index(text, chunk_tokens, overlap_tokens)
+    return [index.passages[i] for i, _ in index.search(query, top_k)]
@@ -0,0 +1,239 @@
+import os
+import re
+import json
+import time
+from collections import OrderedDict
+from threading import RLock
+from typing import Any, Dict, Iterator, List, Optional
+from loguru import logger
+from .base_llm import BaseLLM
+from .custom_typing import Conversation, Message
+
+
+def _strings(value: Any) -> Iterator[str]:
+    # the strings in a converted (vendor format) message
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _strings(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _strings(item)
+
+
+def _message_strings(message: Message) -> List[str]:
+    if isinstance(message.content, str):
+        return [message.content]
+    strings = []
+    for content_item in message.content:
+        if content_item.type == "text":
+            strings.append(content_item.text)
+        elif content_item.type == "image":
+            strings.append(content_item.source.data)
+        elif content_item.type == "tool_use":
+            strings.append(json.dumps(content_item.input))
+        elif content_item.type == "tool_result":
+            strings.append(content_item.content)
+    return strings
+
+
+def conversation_nbytes(conversation: Conversation) -> int:
+    """
+    approximate memory held by a conversation, dominated by text and base64 image data;
+    includes the vendor conversions cached on its messages where they copy the data (e.g. OpenAI image data URLs)
+    """
+    nbytes = 0
+    for node in conversation.messages.nodes():
+        strings = _message_strings(node.message)
+        nbytes += sum(map(len, strings))
+        shared = {id(string) for string in strings}
+        for converted in list(node.conversions.values()):
+            nbytes += sum(len(string) for string in _strings(converted) if id(string) not in shared)
+    return nbytes
+
+
+class Session:
+    def __init__(self, session_id: str, llm: BaseLLM):
+        self.session_id = session_id
+        self.llm = llm
+        self.last_used = time.monotonic()
+        self.nbytes = conversation_nbytes(llm.conversation)
+        # messages already written to the session log, in order
+        self.persisted: List[Message] = list(llm.conversation.messages)
+
+
+class SessionRegistry:
+    """
+    Keeps LLM instances (and their conversations) alive across queue runs, keyed by session id.
+
+    Sessions are evicted least recently used first when there are more than max_sessions,
+    when they hold more than max_bytes of conversation in total, or when idle for longer than idle_seconds.
+    If persist_dir is set, every session is mirrored to an append-only log <persist_dir>/<session_id>.jsonl,
+    so evicted sessions are restored from disk the next time they are used.
+    """
+    def __init__(
+        self,
+        max_sessions: int = 32,
+        max_bytes: int = 256 * 1024 * 1024,
+        idle_seconds: float = 3600,
+        persist_dir: Optional[str] = None
+    ):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.persist_dir = persist_dir
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = RLock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_sessions=int(os.getenv("COMFYUI_LLM_MAX_SESSIONS", 32)),
+            max_bytes=int(float(os.getenv("COMFYUI_LLM_SESSION_MEMORY_MB", 256)) * 1024 * 1024),
+            idle_seconds=float(os.getenv("COMFYUI_LLM_SESSION_IDLE_SECONDS", 3600)),
+            persist_dir=os.getenv("COMFYUI_LLM_SESSION_DIR") or None
+        )
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str):
+        return session_id in self._sessions
+
+    @property
+    def nbytes(self) -> int:
+        return sum(session.nbytes for session in self._sessions.values())
+
+    def get_or_create(self, session_id: str, vendor: str, model: str, model_params: Dict = None, stateful: bool = True) -> BaseLLM:
+        from . import LLM
+
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and (session.llm.vendor, session.llm.model) != (vendor, model):
+                # switching models mid session keeps the history
+                logger.info("Session {} switched to {}/{}", session_id, vendor, model)
+                llm = LLM(vendor, model, model_params, conversation=session.llm.conversation, stateful=stateful)()
+                llm.session_id = session_id
+                # same history, so runs of the old and the new model are serialized too
+                llm.run_lock = session.llm.run_lock
+                session.llm = llm
+            elif session is not None:
+                session.llm.model_params = dict(model_params or {})
+                session.llm.stateful = stateful
+            else:
+                conversation = self._load(session_id)
+                logger.info("Creating session {} ({} messages restored)", session_id, len(conversation.messages))
+                llm = LLM(vendor, model, model_params, conversation=conversation, stateful=stateful)()
+                llm.session_id = session_id
+                session = Session(session_id, llm)
+                self._sessions[session_id] = session
+
+            # a run still in flight (e.g. from Predict Submit) is answering the last message, leave it alone
+            if session.llm.run_lock.acquire(blocking=False):
+                try:
+                    messages = session.llm.conversation.messages
+                    if len(messages) and messages[-1].role == "user":
+                        # a run that failed after its prompt was added, the next prompt can't follow an unanswered one
+                        logger.warning("Dropping unanswered user message of session {}", session_id)
+                        session.llm.conversation.messages = messages[:-1]
+                        session.nbytes = conversation_nbytes(session.llm.conversation)
+                finally:
+                    session.llm.run_lock.release()
+
+            session.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            self._evict()
+            return session.llm
+
+    def sync(self, llm: BaseLLM):
+        """
+        records the current state of a session LLM after it ran: updates its memory usage and appends to its log
+        """
+        with self._lock:
+            session = self._sessions.get(llm.session_id)
+            if session is None or session.llm is not llm:
+                # evicted (or replaced) while running, make it the current session again
+                session = Session(llm.session_id, llm)
+                session.persisted = self._load(llm.session_id).messages
+                self._sessions[llm.session_id] = session
+
+            session.last_used = time.monotonic()
+            session.nbytes = conversation_nbytes(llm.conversation)
+            self._sessions.move_to_end(llm.session_id)
+            if self.persist_dir:
+                self._append(session)
+            self._evict()
+
+    def drop(self, session_id: str, delete_log: bool = False):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if delete_log and self.persist_dir and os.path.exists(self._log_path(session_id)):
+                os.remove(self._log_path(session_id))
+
+    def _evict(self):
+        now = time.monotonic()
+        for session_id in [sid for sid, session in self._sessions.items() if now - session.last_used > self.idle_seconds]:
+            logger.debug("Evicting idle session {}", session_id)
+            del self._sessions[session_id]
+
+        total = self.nbytes
+        # never evict the most recently used session
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or total > self.max_bytes):
+            session_id, session = self._sessions.popitem(last=False)
+            total -= session.nbytes
+            logger.debug("Evicting least recently used session {}", session_id)
+
+    """
+    PERSISTENCE
+    """
+    def _log_path(self, session_id: str) -> str:
+        return os.path.join(self.persist_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", session_id) + ".jsonl")
+
+    def _append(self, session: Session):
+        messages = list(session.llm.conversation.messages)
+        # completions are cleaned up by rewriting the tail of the conversation, so only the common prefix is kept
+        common = 0
+        while common < min(len(messages), len(session.persisted)) and (
+            messages[common] is session.persisted[common] or messages[common] == session.persisted[common]
+        ):
+            common += 1
+
+        records = []
+        if common < len(session.persisted):
+            records.append({"op": "truncate", "length": common})
+        records.extend({"op": "append", "message": message.model_dump()} for message in messages[common:])
+        if records:
+            with open(self._log_path(session.session_id), "a") as f:
+                f.write("".join(json.dumps(record) + "\n" for record in records))
+        session.persisted = messages
+
+    def _load(self, session_id: str) -> Conversation:
+        if not self.persist_dir or not os.path.exists(self._log_path(session_id)):
+            return Conversation(messages=[])
+
+        messages = []
+        path = self._log_path(session_id)
+        with open(path, "rb") as f:
+            lines = f.readlines()
+        offset = 0
+        for line in lines:
+            if not line.endswith(b"\n"):
+                # the last write was cut short (e.g. a crash), drop the torn record so later appends start on a new line
+                logger.warning("Dropping incomplete last record of session log {}", path)
+                with open(path, "r+b") as f:
+                    f.truncate(offset)
+                break
+            offset += len(line)
+            record = json.loads(line)
+            if record["op"] == "append":
+                messages.append(record["message"])
+            elif record["op"] == "truncate":
+                del messages[record["length"]:]
+        return Conversation(messages=messages)
+
+
+SESSION_REGISTRY = SessionRegistry.from_env()
@@ -0,0 +1,75 @@
+import importlib
+import os
+import sys
+import threading
+import time
+import unittest
+from llm.executor import get_executor, submit
+from llm.custom_typing import Conversation
+from llm.openai_compatible import make_openai_compatible_backend
+from llm.session import SESSION_REGISTRY
+from llm.tests.stand_in import StandInServer, chat_completion
+
+# the nodes import the llm package relatively, so they are loaded through the repository package
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(ROOT))
+nodes = importlib.import_module(os.path.basename(ROOT))
+
+
+def conversation():
+    return Conversation(messages=[
+        {"role": "system", "content": "s"},
+        {"role": "user", "content": [{"type": "text", "text": "q"}]},
+        {"role": "assistant", "content": [{"type": "text", "text": "a"}], "finish_reason": "stop"},
+    ])
+
+
+def slow_route(request):
+    time.sleep(0.2)
+    return 200, chat_completion(f"answer {len(request['body'])}")
+
+
+class TestAsyncPredict(unittest.TestCase):
+
+    def test_executor_runs_in_background(self):
+        started = threading.Event()
+        future = submit(lambda x: started.wait(1) and x * 2, 21)
+        started.set()
+        self.assertEqual(future.result(timeout=1), 42)
+        self.assertIs(get_executor(), get_executor())
+
+    def test_submits_on_one_stateful_model_are_forked(self):
+        with StandInServer({"POST /v1/chat/completions": slow_route}) as server:
+            backend = make_openai_compatible_backend("async-stand-in", server.url + "/v1", models=["m"])
+            llm = backend("m", {"max_tokens": 10}, conversation(), stateful=True)
+
+            start = time.monotonic()
+            handles = [nodes.PredictSubmit().submit("s", f"follow-up {i}", llm)[0] for i in range(2)]
+            results = [nodes.PredictAwait().wait(handle, timeout_seconds=5) for handle in handles]
+            # both requests were in flight at the same time
+            self.assertLess(time.monotonic() - start, 0.35)
+
+        self.assertEqual(len(llm.conversation.messages), 3)
+        for i, (text, branch) in enumerate(results):
+            self.assertIsNot(branch, llm)
+            self.assertEqual(text, branch.get_latest_assistant_message(text=True))
+            self.assertEqual(branch.message_text(branch.conversation.messages[3]), f"follow-up {i}")
+            self.assertEqual(len(branch.conversation.messages), 5)
+
+    def test_submits_on_one_session_are_serialized(self):
+        with StandInServer({"POST /v1/chat/completions": slow_route}) as server:
+            backend = make_openai_compatible_backend("async-session-stand-in", server.url + "/v1", models=["m"])
+            llm = backend("m", {"max_tokens": 10}, conversation(), stateful=True)
+            llm.session_id = "async-session"
+            try:
+                handles = [nodes.PredictSubmit().submit("s", f"follow-up {i}", llm)[0] for i in range(2)]
+                for handle in handles:
+                    self.assertIs(nodes.PredictAwait().wait(handle)[1], llm)
+            finally:
+                SESSION_REGISTRY.drop("async-session")
+
+        self.assertEqual([message.role for message in llm.conversation.messages], ["system", "user", "assistant"] + ["user", "assistant"] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
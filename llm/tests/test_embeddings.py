@@ -0,0 +1,115 @@
+import base64
+import json
+import tempfile
+import unittest
+import numpy as np
+from llm.embeddings import embed_cached, embedding_batches, top_k_similar
+from llm.openai_compatible import make_openai_compatible_backend
+from llm.vector_store import VectorStore
+from llm.tests.stand_in import StandInServer
+
+
+def letter_counts(text):
+    vector = np.zeros(26, dtype=np.float32)
+    for char in text.lower():
+        if "a" <= char <= "z":
+            vector[ord(char) - ord("a")] += 1
+    return vector
+
+
+def embeddings_route(request):
+    body = json.loads(request["body"])
+    data = []
+    for i, text in enumerate(body["input"]):
+        vector = letter_counts(text)
+        embedding = base64.b64encode(vector.tobytes()).decode() if body.get("encoding_format") == "base64" else vector.tolist()
+        data.append({"object": "embedding", "index": i, "embedding": embedding})
+    # out of order on purpose, the index decides
+    return 200, {"object": "list", "data": data[::-1], "model": body["model"], "usage": {"prompt_tokens": 1, "total_tokens": 1}}
+
+
+def stand_in_backend(server):
+    backend = make_openai_compatible_backend("stand-in", server.url + "/v1", models=["chat"], embedding_model="letters")
+    backend.EMBEDDING_BATCH_SIZE = 2
+    return backend
+
+
+class TestEmbeddings(unittest.TestCase):
+
+    def test_batches_respect_inputs_and_tokens(self):
+        self.assertEqual(embedding_batches(["a", "b", "c"], 2, 100), [["a", "b"], ["c"]])
+        # estimated at 10, 10 and 1 tokens
+        self.assertEqual(embedding_batches(["a " * 10, "b " * 10, "c"], 10, 15), [["a " * 10], ["b " * 10, "c"]])
+        self.assertEqual(embedding_batches([], 2, 100), [])
+
+    def test_backend_embeds_in_concurrent_batches(self):
+        with StandInServer({"POST /v1/embeddings": embeddings_route}) as server:
+            vectors = stand_in_backend(server).embed(["abc", "bcd", "zzz", "a"])
+            self.assertEqual(vectors.shape, (4, 26))
+            np.testing.assert_array_equal(vectors[2], letter_counts("zzz"))
+            self.assertEqual(len(server.requests), 2)
+
+    def test_store_embeds_each_text_once(self):
+        with StandInServer({"POST /v1/embeddings": embeddings_route}) as server, tempfile.TemporaryDirectory() as path:
+            backend = stand_in_backend(server)
+            store = VectorStore(path)
+            embed_cached(backend, ["apple", "banana"], store)
+            vectors = embed_cached(backend, ["banana", "cherry", "apple"], store)
+            np.testing.assert_array_equal(vectors[0], letter_counts("banana"))
+            inputs = [text for request in server.requests for text in json.loads(request["body"])["input"]]
+            self.assertEqual(sorted(inputs), ["apple", "banana", "cherry"])
+
+            # reopened from disk
+            reopened = VectorStore(path)
+            self.assertEqual(len(reopened), 3)
+            np.testing.assert_array_equal(reopened.get([next(iter(reopened._rows))])[0], letter_counts("apple"))
+
+    def test_float16_store(self):
+        with tempfile.TemporaryDirectory() as path:
+            store = VectorStore(path, dtype="float16")
+            store.add(["a", "b"], np.array([[0.1, 0.2], [0.3, 0.4]], dtype=np.float32))
+            store.add(["b", "c"], np.array([[9, 9], [0.5, 0.6]], dtype=np.float32))
+            vectors = VectorStore(path).get(["c", "a", "b"])
+            self.assertEqual(vectors.dtype, np.float32)
+            np.testing.assert_allclose(vectors, [[0.5, 0.6], [0.1, 0.2], [0.3, 0.4]], atol=1e-3)
+            with self.assertRaises(ValueError):
+                store.add(["d"], np.zeros((1, 3)))
+
+    def test_store_drops_rows_of_interrupted_append(self):
+        with tempfile.TemporaryDirectory() as path:
+            store = VectorStore(path)
+            store.add(["a"], np.array([[1, 1]], dtype=np.float32))
+            # a crash after writing the rows of an append, before its keys
+            with open(f"{path}/vectors.bin", "ab") as f:
+                f.write(np.array([[9, 9]], dtype=np.float32).tobytes())
+
+            reopened = VectorStore(path)
+            reopened.add(["b"], np.array([[2, 2]], dtype=np.float32))
+            np.testing.assert_array_equal(reopened.get(["a", "b"]), [[1, 1], [2, 2]])
+            np.testing.assert_array_equal(VectorStore(path).get(["a", "b"]), [[1, 1], [2, 2]])
+
+            # the same in a store that was open during the crash
+            with open(f"{path}/vectors.bin", "ab") as f:
+                f.write(np.array([[9, 9]], dtype=np.float32).tobytes())
+            reopened.add(["c"], np.array([[3, 3]], dtype=np.float32))
+            np.testing.assert_array_equal(VectorStore(path).get(["c", "b"]), [[3, 3], [2, 2]])
+
+    def test_store_instances_appending_the_same_key(self):
+        with tempfile.TemporaryDirectory() as path:
+            first, second = VectorStore(path), VectorStore(path)
+            first.add(["a"], np.array([[1, 1]], dtype=np.float32))
+            second.add(["a", "b"], np.array([[1, 1], [2, 2]], dtype=np.float32))
+            first.add(["b", "c"], np.array([[2, 2], [3, 3]], dtype=np.float32))
+            for store in (first, second, VectorStore(path)):
+                np.testing.assert_array_equal(store.get(["a", "b"]), [[1, 1], [2, 2]])
+            np.testing.assert_array_equal(VectorStore(path).get(["c"]), [[3, 3]])
+
+    def test_top_k_similar(self):
+        vectors = np.array([[1, 0], [0, 1], [1, 1], [0, 0]], dtype=np.float32)
+        results = top_k_similar(np.array([1, 0.1], dtype=np.float32), vectors, 2)
+        self.assertEqual([i for i, _ in results], [0, 2])
+        self.assertEqual(top_k_similar(np.ones(2), np.zeros((0, 2)), 3), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
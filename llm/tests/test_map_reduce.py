@@ -0,0 +1,70 @@
+import unittest
+from llm.base_llm import BaseLLM
+from llm.chunking import split_text
+from llm.tokenizer import estimate_text_tokens
+from llm.map_reduce import MapReduce, Chunk, count_reduce_calls
+
+
+class EchoLLM(BaseLLM):
+    """
+    stand-in LLM that answers with the length of the last user prompt
+    """
+    calls = []
+
+    def __init__(self, model: str = "echo", model_params=None, conversation=None, stateful: bool = True):
+        super().__init__("echo", model, model_params, conversation, stateful)
+
+    def run(self, until_completion: bool = False, until_completion_user_message=None):
+        prompt = self.conversation.messages[-1].content[-1].text
+        EchoLLM.calls.append(prompt)
+        return f"<{len(prompt)}>"
+
+
+class TestMapReduce(unittest.TestCase):
+
+    def setUp(self):
+        EchoLLM.calls = []
+
+    def test_split_text_respects_chunk_size(self):
+        text = "\n\n".join(["word " * 50] * 40)
+        chunks = split_text(text, chunk_tokens=100, overlap_tokens=10)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(estimate_text_tokens(chunk), 100)
+        overlap = chunks[1].split("\n\n")[0]
+        self.assertTrue(chunks[0].endswith(overlap))
+        self.assertEqual(estimate_text_tokens(overlap), 10)
+
+    def test_split_text_breaks_long_paragraphs(self):
+        chunks = split_text("word " * 250 + "x" * 1000, chunk_tokens=100)
+        self.assertEqual([estimate_text_tokens(chunk) for chunk in chunks], [100, 100, 50, 100, 68])
+
+    def test_count_reduce_calls(self):
+        self.assertEqual(count_reduce_calls(1, 4), 0)
+        self.assertEqual(count_reduce_calls(4, 4), 1)
+        # 9 -> [4, 4, 1] -> 3 partials -> 1
+        self.assertEqual(count_reduce_calls(9, 4), 3)
+
+    def test_tree_reduce(self):
+        progress = []
+        runner = MapReduce(
+            EchoLLM(conversation=None),
+            map_prompt="map {{ chunk }}",
+            reduce_prompt="reduce {{ partials | join(',') }}",
+            max_concurrency=3,
+            fan_in=2,
+            on_progress=lambda done, total: progress.append((done, total))
+        )
+        result, partials = runner.run([Chunk(text=str(i)) for i in range(5)])
+
+        self.assertEqual(partials, ["<5>"] * 5)
+        self.assertTrue(result.startswith("<"))
+        self.assertEqual(len(EchoLLM.calls), 5 + count_reduce_calls(5, 2))
+        self.assertEqual(progress[-1], (len(EchoLLM.calls), len(EchoLLM.calls)))
+
+    def test_empty_input(self):
+        with self.assertRaises(ValueError):
+            MapReduce(EchoLLM()).run([])
+
+if __name__ == '__main__':
+    unittest.main()
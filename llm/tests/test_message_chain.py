@@ -0,0 +1,95 @@
+import unittest
+from llm import BaseOpenAI
+from llm.custom_typing import Conversation, UserMessage, AssistantMessage
+from llm.message_chain import MessageChain
+
+
+def user(text):
+    return UserMessage(content=[{"type": "text", "text": text}])
+
+
+class CountingOpenAI(BaseOpenAI):
+    converted = []
+
+    def _convert_message(self, message):
+        self.converted.append(self.message_text(message))
+        return super()._convert_message(message)
+
+
+class TestMessageChain(unittest.TestCase):
+
+    def test_behaves_like_a_list(self):
+        chain = MessageChain([1, 2, 3])
+        chain.append(4)
+        self.assertEqual(list(chain), [1, 2, 3, 4])
+        self.assertEqual((len(chain), chain[0], chain[-1]), (4, 1, 4))
+        self.assertEqual(list(reversed(chain)), [4, 3, 2, 1])
+        self.assertEqual(list(chain[1:3]), [2, 3])
+        self.assertEqual(list(chain[::-1]), [4, 3, 2, 1])
+        self.assertEqual(chain.index(3), 2)
+        chain[1] = 20
+        del chain[0]
+        chain.insert(0, 0)
+        chain.insert(-1, 9)
+        self.assertEqual(chain, [0, 20, 3, 9, 4])
+        self.assertEqual(chain.pop(), 4)
+        # inserting through an empty slice, e.g. a system message in front
+        chain[0:0] = ["system"]
+        chain[2:2] = ["x", "y"]
+        self.assertEqual(chain, ["system", 0, "x", "y", 20, 3, 9])
+        with self.assertRaises(IndexError):
+            chain[10]
+
+    def test_slice_assignment_matches_list(self):
+        cases = [
+            (slice(0, 0), ["x"]), (slice(1, 1), ["x", "y"]), (slice(5, 5), ["x"]), (slice(-1, -1), ["x"]),
+            (slice(2, 1), ["x"]), (slice(1, 3), ["x"]), (slice(None), []), (slice(None, None, 2), ["x", "y"]),
+            (slice(None, None, -2), ["x", "y"]),
+        ]
+        for index, value in cases:
+            with self.subTest(index=index):
+                chain, expected = MessageChain([0, 1, 2, 3]), [0, 1, 2, 3]
+                chain[index] = value
+                expected[index] = value
+                self.assertEqual(list(chain), expected)
+                self.assertEqual(len(chain), len(expected))
+                del chain[index]
+                del expected[index]
+                self.assertEqual(list(chain), expected)
+
+    def test_forks_share_prefix_and_diverge(self):
+        chain = MessageChain(["system", "user"])
+        a, b = chain.fork(), chain.fork()
+        a.append("a")
+        b.append("b")
+        self.assertEqual((list(chain), list(a), list(b)), (["system", "user"], ["system", "user", "a"], ["system", "user", "b"]))
+        self.assertIs(a.nodes()[1], b.nodes()[1])
+        # a prefix slice shares nodes too
+        self.assertIs(a[:2].nodes()[-1], chain.nodes()[-1])
+        # modifying a fork before its end leaves the others alone
+        a[0] = "other"
+        self.assertEqual(list(b), ["system", "user", "b"])
+
+    def test_conversation_fork_and_assignment(self):
+        conversation = Conversation(messages=[{"role": "system", "content": "s"}, {"role": "user", "content": [{"type": "text", "text": "q"}]}])
+        fork = conversation.fork()
+        fork.messages.append(AssistantMessage(content=[{"type": "text", "text": "a"}], finish_reason="stop"))
+        self.assertEqual(len(conversation.messages), 2)
+        conversation.messages = list(fork.messages)[:1]
+        self.assertIsInstance(conversation.messages, MessageChain)
+        self.assertEqual(Conversation.model_validate(fork.model_dump()).messages, fork.messages)
+
+    def test_forked_llms_reuse_prefix_conversions(self):
+        CountingOpenAI.converted = []
+        llm = CountingOpenAI("gpt-4o-mini", conversation=Conversation(messages=[{"role": "system", "content": "s"}, user("shared")]))
+        llm.convert_conversation()
+        branches = [llm.clone() for _ in range(3)]
+        for i, branch in enumerate(branches):
+            branch.add_message_to_conversation(user(f"branch {i}"))
+            self.assertEqual(branch.convert_conversation()[-1]["content"][0]["text"], f"branch {i}")
+        self.assertEqual(CountingOpenAI.converted, ["s", "shared", "branch 0", "branch 1", "branch 2"])
+        self.assertEqual(len(llm.conversation.messages), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
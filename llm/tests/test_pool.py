@@ -0,0 +1,146 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from openai import OpenAI
+from llm import BaseOpenAI
+from llm.custom_typing import Conversation
+from llm.pool import Endpoint, EndpointPool
+from llm.tests.stand_in import StandInServer, chat_completion
+
+
+def endpoint(name, server):
+    return Endpoint(name, OpenAI, api_key="test", base_url=server.url + "/v1", max_retries=0)
+
+
+def completion_route(text, status=200, headers=None):
+    def route(request):
+        if status != 200:
+            return status, {"error": {"message": f"status {status}"}}, headers or {}
+        return 200, chat_completion(text), headers or {}
+    return route
+
+
+def create(pool):
+    return pool.request(lambda endpoint: endpoint.client.chat.completions.with_raw_response.create(
+        model="stand-in", messages=[{"role": "user", "content": "hi"}]
+    ))
+
+
+class TestEndpointPool(unittest.TestCase):
+
+    def test_fails_over_on_server_errors_and_opens_circuit(self):
+        with StandInServer({"POST /v1/chat/completions": completion_route("", status=529)}) as down, \
+                StandInServer({"POST /v1/chat/completions": completion_route("from backup")}) as up:
+            pool = EndpointPool([endpoint("down", down), endpoint("up", up)], failure_threshold=2, cooldown_seconds=60)
+            # both idle, the first endpoint is tried first
+            self.assertEqual(create(pool).choices[0].message.content, "from backup")
+            self.assertEqual(create(pool).choices[0].message.content, "from backup")
+            self.assertEqual(len(down.requests), 2)
+            # the circuit is open now, requests go straight to the healthy endpoint
+            create(pool)
+            self.assertEqual(len(down.requests), 2)
+            self.assertEqual(len(up.requests), 3)
+
+    def test_raises_when_all_endpoints_fail(self):
+        with StandInServer({"POST /v1/chat/completions": completion_route("", status=500)}) as a, \
+                StandInServer({"POST /v1/chat/completions": completion_route("", status=503)}) as b:
+            pool = EndpointPool([endpoint("a", a), endpoint("b", b)])
+            with self.assertRaises(Exception) as context:
+                create(pool)
+            self.assertIn(getattr(context.exception, "status_code", None), (500, 503))
+            self.assertEqual(len(a.requests) + len(b.requests), 2)
+
+    def test_client_errors_are_not_failed_over(self):
+        with StandInServer({"POST /v1/chat/completions": completion_route("", status=400)}) as a, \
+                StandInServer({"POST /v1/chat/completions": completion_route("unused")}) as b:
+            pool = EndpointPool([endpoint("a", a), endpoint("b", b)])
+            with self.assertRaises(Exception):
+                create(pool)
+            self.assertEqual(len(b.requests), 0)
+
+    def test_rate_limited_endpoint_is_skipped_until_retry_after(self):
+        with StandInServer({"POST /v1/chat/completions": completion_route("", status=429, headers={"retry-after": "60"})}) as limited, \
+                StandInServer({"POST /v1/chat/completions": completion_route("ok")}) as free:
+            pool = EndpointPool([endpoint("limited", limited), endpoint("free", free)])
+            create(pool)
+            create(pool)
+            self.assertEqual(len(limited.requests), 1)
+            self.assertEqual(len(free.requests), 2)
+
+    def test_headroom_strategy_follows_rate_limit_headers(self):
+        with StandInServer({"POST /v1/chat/completions": completion_route("a", headers={"x-ratelimit-remaining-requests": "5"})}) as a, \
+                StandInServer({"POST /v1/chat/completions": completion_route("b", headers={"x-ratelimit-remaining-requests": "500"})}) as b:
+            pool = EndpointPool([endpoint("a", a), endpoint("b", b)], strategy="headroom")
+            for _ in range(4):
+                create(pool)
+            self.assertEqual(pool.endpoints[0].remaining_requests, 5)
+            self.assertEqual(len(a.requests), 1)
+            self.assertEqual(len(b.requests), 3)
+
+    def test_least_outstanding_prefers_idle_endpoint(self):
+        pool = EndpointPool([Endpoint("busy", OpenAI, weight=2), Endpoint("idle", OpenAI)])
+        pool.endpoints[0].outstanding = 3
+        self.assertEqual(pool.select().name, "idle")
+        pool.endpoints[1].outstanding = 2
+        self.assertEqual(pool.select().name, "busy")
+
+    def test_client_is_created_once(self):
+        created = []
+        def factory(**kwargs):
+            created.append(kwargs)
+            time.sleep(0.05)
+            return object()
+        pool = EndpointPool([Endpoint("a", factory, api_key="test")])
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(pool.endpoints[0].client)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(created), 1)
+        self.assertEqual(len({id(client) for client in clients}), 1)
+
+    def test_backend_creates_one_pool_under_concurrency(self):
+        class Backend(BaseOpenAI):
+            @classmethod
+            def default_endpoints(cls):
+                time.sleep(0.05)
+                return [{"api_key": "test"}]
+        pools = []
+        threads = [threading.Thread(target=lambda: pools.append(Backend.get_pool())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({id(pool) for pool in pools}), 1)
+
+    def test_backend_reads_endpoints_file(self):
+        with StandInServer({"POST /v1/chat/completions": completion_route("", status=502)}) as down, \
+                StandInServer({"POST /v1/chat/completions": completion_route("pooled")}) as up:
+            config = {"pooled": {"endpoints": [
+                {"name": "down", "api_key": "a", "base_url": down.url + "/v1"},
+                {"name": "up", "api_key_env": "POOLED_TEST_KEY", "base_url": up.url + "/v1"},
+            ]}}
+            with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+                json.dump(config, f)
+            os.environ["COMFYUI_LLM_ENDPOINTS_FILE"] = f.name
+            os.environ["POOLED_TEST_KEY"] = "b"
+            try:
+                class PooledOpenAI(BaseOpenAI):
+                    VENDOR = "pooled"
+                    ALLOWED_MODELS = ["stand-in"]
+                llm = PooledOpenAI("stand-in", {"max_tokens": 10}, Conversation(messages=[{"role": "user", "content": [{"type": "text", "text": "hi"}]}]))
+                self.assertEqual(llm.run(), "pooled")
+                self.assertEqual(up.requests[0]["headers"]["authorization"], "Bearer b")
+                self.assertEqual([e.client.max_retries for e in PooledOpenAI.get_pool().endpoints], [0, 0])
+            finally:
+                del os.environ["COMFYUI_LLM_ENDPOINTS_FILE"]
+                del os.environ["POOLED_TEST_KEY"]
+                os.unlink(f.name)
+
+
+if __name__ == '__main__':
+    unittest.main()
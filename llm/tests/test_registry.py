@@ -0,0 +1,60 @@
+import json
+import unittest
+from llm import LLM, BaseOpenAI, register_vendor
+from llm.registry import get_vendor, flat_vendor_models, register_openai_compatible
+from llm.custom_typing import Conversation
+from llm.tests.stand_in import StandInServer, chat_completion
+
+
+class TestVendorRegistry(unittest.TestCase):
+
+    def test_builtin_vendors(self):
+        self.assertIs(get_vendor("openai"), BaseOpenAI)
+        self.assertIn("anthropic/claude-3-5-sonnet-20240620", flat_vendor_models())
+
+    def test_lazy_registration(self):
+        loads = []
+        def load():
+            loads.append(1)
+            return BaseOpenAI
+        register_vendor("lazy-test", load)
+        self.assertEqual(loads, [])
+        self.assertIs(get_vendor("lazy-test"), BaseOpenAI)
+        self.assertIs(get_vendor("lazy-test"), BaseOpenAI)
+        self.assertEqual(loads, [1])
+
+    def test_openai_compatible_backend(self):
+        routes = {
+            "GET /v1/models": lambda request: (200, {"object": "list", "data": [{"id": "org/local-model", "object": "model", "created": 0, "owned_by": "me"}]}),
+            "POST /v1/chat/completions": lambda request: (200, chat_completion("hi from " + json.loads(request["body"])["model"])),
+        }
+        with StandInServer(routes) as server:
+            register_openai_compatible("stand-in", f"{server.url}/v1")
+            self.assertIn("stand-in/org/local-model", flat_vendor_models())
+            # the model list is cached
+            flat_vendor_models()
+            self.assertEqual(sum(request["path"] == "/v1/models" for request in server.requests), 1)
+
+            conversation = Conversation(messages=[
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": [{"type": "text", "text": "Hello!"}]}
+            ])
+            llm = LLM("stand-in", "org/local-model", conversation=conversation)()
+            self.assertEqual(llm.run(), "hi from org/local-model")
+            self.assertEqual(server.requests[-1]["headers"]["authorization"], "Bearer EMPTY")
+
+            with self.assertRaisesRegex(ValueError, "Model other is not supported"):
+                LLM("stand-in", "other")()
+
+    def test_failed_model_listing_is_not_retried(self):
+        routes = {"GET /v1/models": lambda request: (503, {"error": {"message": "loading"}})}
+        with StandInServer(routes) as server:
+            register_openai_compatible("stand-in-down", f"{server.url}/v1")
+            self.assertNotIn("stand-in-down", [model.split("/")[0] for model in flat_vendor_models()])
+            with self.assertRaises(Exception):
+                get_vendor("stand-in-down").available_models()
+            # asked once, without client retries, and the failure is cached for the TTL
+            self.assertEqual(len(server.requests), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import importlib
+import os
+import random
+import sys
+import time
+import unittest
+from llm.retrieval import BM25Index, get_index, retrieve
+
+# the nodes import the llm package relatively, so they are loaded through the repository package
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(ROOT))
+nodes = importlib.import_module(os.path.basename(ROOT))
+
+
+class TestRetrieval(unittest.TestCase):
+
+    def test_ranks_passages_by_bm25(self):
+        index = BM25Index([
+            "the cat sat on the mat",
+            "invoice due in thirty days",
+            "the invoice number is 4711, the invoice total is 120 EUR",
+            "",
+        ])
+        results = index.search("invoice total", top_k=5)
+        self.assertEqual([i for i, _ in results], [2, 1])
+        self.assertGreater(results[0][1], results[1][1])
+        self.assertEqual(index.search("unknown words", top_k=5), [])
+        self.assertEqual(len(index.search("the", top_k=1)), 1)
+
+    def test_empty_document(self):
+        self.assertEqual(retrieve("", "anything"), [])
+
+    def test_index_is_cached_by_document(self):
+        text = "alpha beta\n\ngamma delta"
+        self.assertIs(get_index(text, 50, 0), get_index(text, 50, 0))
+        self.assertIsNot(get_index(text, 50, 0), get_index(text, 60, 0))
+
+    def test_node_accepts_smallest_chunks(self):
+        # chunk_tokens at its minimum and the default overlap
+        passages, = nodes.Retrieve().retrieve("alpha beta gamma\n\ndelta epsilon", "delta", 1, 20, 20)
+        self.assertIn("delta", passages)
+
+    def test_indexes_thousand_pages(self):
+        words = [f"word{i}" for i in range(20000)]
+        rng = random.Random(0)
+        pages = [" ".join(rng.choices(words, k=500)) for _ in range(1000)]
+        pages[617] += " needle haystack"
+        text = "\n\n".join(pages)
+
+        start = time.perf_counter()
+        passages = retrieve(text, "needle", top_k=3)
+        # ~0.5s here; a generous bound that only catches regressions in complexity, not slow machines
+        self.assertLess(time.perf_counter() - start, 5.0)
+        # the overlap of the next passage can repeat the needle
+        self.assertTrue(passages)
+        self.assertTrue(all("needle" in passage for passage in passages))
+
+
+if __name__ == '__main__':
+    unittest.main()
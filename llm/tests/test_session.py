@@ -0,0 +1,112 @@
+import tempfile
+import threading
+import unittest
+from llm import LLM, BaseOpenAI
+from llm.custom_typing import AssistantMessage, UserMessage
+from llm.session import SessionRegistry, conversation_nbytes
+
+
+class TestSessionRegistry(unittest.TestCase):
+
+    def test_default_conversation_is_not_shared(self):
+        first = LLM(BaseOpenAI.VENDOR, "gpt-4o")()
+        second = LLM(BaseOpenAI.VENDOR, "gpt-4o")()
+        first.add_message_to_conversation(UserMessage(content=[{"type": "text", "text": "Hello!"}]))
+        self.assertEqual(len(second.conversation.messages), 0)
+        self.assertIsNot(first.model_params, second.model_params)
+
+    def test_reuses_llm_per_session(self):
+        registry = SessionRegistry()
+        llm = registry.get_or_create("a", "openai", "gpt-4o", {"max_tokens": 10})
+        self.assertIs(registry.get_or_create("a", "openai", "gpt-4o", {"max_tokens": 20}), llm)
+        self.assertEqual(llm.model_params, {"max_tokens": 20})
+        self.assertIsNot(registry.get_or_create("b", "openai", "gpt-4o").conversation, llm.conversation)
+
+    def test_drops_unanswered_user_message(self):
+        registry = SessionRegistry()
+        llm = registry.get_or_create("a", "openai", "gpt-4o")
+        llm.add_message_to_conversation(UserMessage(content=[{"type": "text", "text": "Hello!"}]))
+        llm.add_message_to_conversation(AssistantMessage(content=[{"type": "text", "text": "Hi"}], finish_reason="stop"))
+        # the run of this prompt failed
+        llm.add_message_to_conversation(UserMessage(content=[{"type": "text", "text": "And?"}]))
+
+        # not while a run (on another thread) may still answer it
+        running = threading.Event()
+        done = threading.Event()
+        def run():
+            with llm.run_lock:
+                running.set()
+                done.wait()
+        thread = threading.Thread(target=run)
+        thread.start()
+        running.wait()
+        registry.get_or_create("a", "openai", "gpt-4o")
+        self.assertEqual([message.role for message in llm.conversation.messages], ["user", "assistant", "user"])
+        done.set()
+        thread.join()
+
+        llm = registry.get_or_create("a", "openai", "gpt-4o")
+        self.assertEqual([message.role for message in llm.conversation.messages], ["user", "assistant"])
+
+    def test_nbytes_counts_converted_images(self):
+        llm = LLM(BaseOpenAI.VENDOR, "gpt-4o")()
+        data = "A" * 10000
+        llm.add_message_to_conversation(UserMessage(content=[
+            {"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": data}},
+        ]))
+        self.assertEqual(conversation_nbytes(llm.conversation), len(data))
+        # the data URL of the OpenAI format is a second copy of the image
+        llm.convert_conversation()
+        self.assertGreater(conversation_nbytes(llm.conversation), 2 * len(data))
+
+    def test_lru_and_memory_eviction(self):
+        registry = SessionRegistry(max_sessions=2, max_bytes=1000)
+        for session_id in ["a", "b", "c"]:
+            registry.get_or_create(session_id, "openai", "gpt-4o")
+        self.assertNotIn("a", registry)
+        self.assertEqual(len(registry), 2)
+
+        llm = registry.get_or_create("c", "openai", "gpt-4o")
+        llm.add_message_to_conversation(UserMessage(content=[{"type": "text", "text": "x" * 2000}]))
+        registry.sync(llm)
+        self.assertEqual(len(registry), 1)
+        self.assertIn("c", registry)
+
+    def test_persistence_round_trip(self):
+        with tempfile.TemporaryDirectory() as persist_dir:
+            registry = SessionRegistry(persist_dir=persist_dir)
+            llm = registry.get_or_create("chat/1", "openai", "gpt-4o")
+            llm.add_message_to_conversation(UserMessage(content=[{"type": "text", "text": "Hello!"}]))
+            llm.add_message_to_conversation(AssistantMessage(content=[{"type": "text", "text": "Hi"}], finish_reason="length"))
+            registry.sync(llm)
+            # completion cleanup rewrites the tail
+            llm.conversation.messages[-1] = AssistantMessage(content=[{"type": "text", "text": "Hi there"}], finish_reason="stop")
+            registry.sync(llm)
+
+            restored = SessionRegistry(persist_dir=persist_dir).get_or_create("chat/1", "openai", "gpt-4o")
+            self.assertEqual(restored.conversation.messages, llm.conversation.messages)
+            self.assertIsNot(restored, llm)
+
+    def test_torn_last_record_is_dropped(self):
+        with tempfile.TemporaryDirectory() as persist_dir:
+            registry = SessionRegistry(persist_dir=persist_dir)
+            llm = registry.get_or_create("a", "openai", "gpt-4o")
+            llm.add_message_to_conversation(UserMessage(content=[{"type": "text", "text": "Hello!"}]))
+            llm.add_message_to_conversation(AssistantMessage(content=[{"type": "text", "text": "Hi"}], finish_reason="stop"))
+            registry.sync(llm)
+            # a crash in the middle of the next write
+            with open(registry._log_path("a"), "a") as f:
+                f.write('{"op": "append", "message": {"role": "us')
+
+            registry = SessionRegistry(persist_dir=persist_dir)
+            restored = registry.get_or_create("a", "openai", "gpt-4o")
+            self.assertEqual(restored.conversation.messages, llm.conversation.messages)
+            # and the log stays readable after more writes
+            restored.add_message_to_conversation(UserMessage(content=[{"type": "text", "text": "More"}]))
+            restored.add_message_to_conversation(AssistantMessage(content=[{"type": "text", "text": "Sure"}], finish_reason="stop"))
+            registry.sync(restored)
+            again = SessionRegistry(persist_dir=persist_dir).get_or_create("a", "openai", "gpt-4o")
+            self.assertEqual(again.conversation.messages, restored.conversation.messages)
+
+if __name__ == '__main__':
+    unittest.main()
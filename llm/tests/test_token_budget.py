@@ -0,0 +1,101 @@
+import base64
+import io
+import json
+import unittest
+from PIL import Image
+from llm import LLM, register_openai_compatible
+from llm.custom_typing import Conversation
+from llm import tokenizer
+from llm.tokenizer import estimate_text_tokens, estimate_conversation_tokens, estimate_image_tokens, image_size
+from llm.uploads import content_hash
+from llm.token_budget import size_max_tokens, ContextWindowExceeded, DEFAULT_OUTPUT_TOKENS, MIN_OUTPUT_TOKENS
+from llm.tests.stand_in import StandInServer, chat_completion
+
+
+def jpeg_base64(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height)).save(buffer, format="JPEG")
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+class TestTokenBudget(unittest.TestCase):
+
+    def test_estimates(self):
+        self.assertEqual(estimate_text_tokens("Hello, world!"), 4)
+        self.assertEqual(estimate_image_tokens(512, 512, "openai"), 85 + 170)
+        conversation = Conversation(messages=[
+            {"role": "user", "content": [
+                {"type": "text", "text": "Hello!"},
+                {"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": jpeg_base64(750, 100)}},
+            ]}
+        ])
+        self.assertEqual(estimate_conversation_tokens(conversation, "anthropic"), 4 + 2 + 101)
+
+    def test_image_sizes_are_cached_by_hash(self):
+        data = jpeg_base64(64, 32)
+        self.assertEqual(image_size(data), (64, 32))
+        # the cache keeps the hash, not the image
+        self.assertEqual(tokenizer._IMAGE_SIZES[content_hash(data)], (64, 32))
+        self.assertNotIn(data, tokenizer._IMAGE_SIZES)
+
+    def test_size_max_tokens(self):
+        # first use reserves a bounded default, not the model's max output
+        self.assertEqual(size_max_tokens(1000, 128000, 16384), DEFAULT_OUTPUT_TOKENS)
+        self.assertEqual(size_max_tokens(1000, 128000, 2000), 2000)
+        # then what was observed, plus headroom, which can go above the default
+        self.assertEqual(size_max_tokens(1000, 128000, 16384, observed=1000), 1500)
+        self.assertEqual(size_max_tokens(1000, 128000, 16384, observed=DEFAULT_OUTPUT_TOKENS), 6000)
+        self.assertEqual(size_max_tokens(1000, 128000, 16384, observed=10), MIN_OUTPUT_TOKENS)
+        # never more than what fits in the context window
+        self.assertEqual(size_max_tokens(7000, 8000, 4096), 8000 - 7000 - 400)
+        # a prompt that leaves no room for an answer is an error, not a 1 token request
+        with self.assertRaises(ContextWindowExceeded):
+            size_max_tokens(7500, 8000, 4096)
+        # an unknown context window doesn't bound the output
+        self.assertEqual(size_max_tokens(100000, None, 4096), DEFAULT_OUTPUT_TOKENS)
+
+    def test_unknown_model_is_not_capped_by_a_guessed_window(self):
+        register_openai_compatible("unknown-window-stand-in", "http://localhost:1/v1", models=["local"])
+        llm = LLM("unknown-window-stand-in", "local", model_params={"max_tokens": 0}, conversation=Conversation(messages=[
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": [{"type": "text", "text": "word " * 9000}]}
+        ]))()
+        self.assertEqual(llm.request_params(), {"max_tokens": DEFAULT_OUTPUT_TOKENS})
+
+    def test_overflowing_prompt_fails_without_retries(self):
+        requests = []
+        with StandInServer({"POST /v1/chat/completions": lambda request: requests.append(request) or (200, chat_completion("hi"))}) as server:
+            register_openai_compatible("overflow-stand-in", f"{server.url}/v1", models=["small"],
+                                       capabilities={"small": {"context_window": 8000, "max_output_tokens": 2000}})
+            llm = LLM("overflow-stand-in", "small", model_params={"max_tokens": 0}, conversation=Conversation(messages=[
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": [{"type": "text", "text": "word " * 9000}]}
+            ]))()
+            with self.assertRaisesRegex(ContextWindowExceeded, "context window"):
+                llm.run()
+        self.assertEqual(requests, [])
+
+    def test_request_sizes_max_tokens_from_observed_output(self):
+        requests = []
+        def complete(request):
+            requests.append(json.loads(request["body"]))
+            response = chat_completion("hi")
+            response["usage"]["completion_tokens"] = 1000
+            return 200, response
+
+        with StandInServer({"POST /v1/chat/completions": complete}) as server:
+            register_openai_compatible("budget-stand-in", f"{server.url}/v1", models=["small"],
+                                       capabilities={"small": {"context_window": 32000, "max_output_tokens": 2000}})
+            for _ in range(2):
+                conversation = Conversation(messages=[
+                    {"role": "system", "content": "You are a helpful assistant."},
+                    {"role": "user", "content": [{"type": "text", "text": "Hello!"}]}
+                ])
+                llm = LLM("budget-stand-in", "small", model_params={"max_tokens": 0}, conversation=conversation)()
+                llm.budget_key = "node-1"
+                llm.run()
+
+        self.assertEqual([request["max_tokens"] for request in requests], [2000, 1500])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import json
+import time
+import unittest
+from llm import LLM, register_openai_compatible
+from llm.custom_typing import Conversation, ToolUseContent
+from llm.tools import Tool, ToolExecutor
+from llm.tests.stand_in import StandInServer, chat_completion
+
+
+def tool_calls_completion(calls):
+    response = chat_completion(None, finish_reason="tool_calls")
+    response["choices"][0]["message"]["tool_calls"] = [
+        {"id": f"call_{i}", "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+        for i, (name, arguments) in enumerate(calls)
+    ]
+    return response
+
+
+class TestTools(unittest.TestCase):
+
+    def test_executor_runs_calls_concurrently_with_timeouts_and_cache(self):
+        calls = []
+        def slow_add(a, b):
+            calls.append((a, b))
+            time.sleep(0.3)
+            return a + b
+        executor = ToolExecutor([
+            Tool("add", slow_add),
+            Tool("hang", lambda: time.sleep(1), timeout=0.2),
+        ])
+
+        start = time.monotonic()
+        results = executor.run([
+            ToolUseContent(id="1", name="add", input={"a": 1, "b": 2}),
+            ToolUseContent(id="2", name="add", input={"a": 3, "b": 4}),
+            ToolUseContent(id="3", name="hang", input={}),
+            ToolUseContent(id="4", name="missing", input={}),
+        ])
+        self.assertLess(time.monotonic() - start, 0.55)
+        self.assertEqual([result.content for result in results[:2]], ["3", "7"])
+        self.assertTrue(results[2].is_error and "timed out" in results[2].content)
+        self.assertTrue(results[3].is_error)
+
+        executor.run([ToolUseContent(id="5", name="add", input={"b": 2, "a": 1})])
+        self.assertEqual(len(calls), 2)
+
+        # identical calls within one turn run once, each gets the result under its own id
+        results = executor.run([
+            ToolUseContent(id="6", name="add", input={"a": 5, "b": 6}),
+            ToolUseContent(id="7", name="add", input={"b": 6, "a": 5}),
+        ])
+        self.assertEqual([(result.tool_use_id, result.content) for result in results], [("6", "11"), ("7", "11")])
+        self.assertEqual(len(calls), 3)
+
+    def test_timeout_runs_from_submission(self):
+        executor = ToolExecutor([
+            Tool("slow", lambda: time.sleep(0.6) or "done"),
+            Tool("hang", lambda: time.sleep(2), timeout=0.2),
+        ])
+        start = time.monotonic()
+        results = executor.run([ToolUseContent(id="1", name="slow", input={}), ToolUseContent(id="2", name="hang", input={})])
+        # the hanging tool was not waited for again after the slow one finished
+        self.assertLess(time.monotonic() - start, 0.75)
+        self.assertEqual(results[0].content, "done")
+        self.assertIn("timed out after 0.2s", results[1].content)
+
+    def test_agent_loop(self):
+        requests = []
+        def complete(request):
+            requests.append(json.loads(request["body"]))
+            if len(requests) == 1:
+                return 200, tool_calls_completion([("weather", {"city": "Chennai"}), ("weather", {"city": "Delhi"})])
+            return 200, chat_completion("Hot in both")
+
+        with StandInServer({"POST /v1/chat/completions": complete}) as server:
+            register_openai_compatible("tools-stand-in", f"{server.url}/v1", models=["agent"])
+            conversation = Conversation(messages=[
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": [{"type": "text", "text": "Weather in Chennai and Delhi?"}]}
+            ])
+            llm = LLM("tools-stand-in", "agent", model_params={"max_tokens": 100}, conversation=conversation, stateful=True)()
+            llm.add_tool(Tool("weather", lambda city: f"{city}: 35C", description="current weather",
+                              parameters={"type": "object", "properties": {"city": {"type": "string"}}}))
+
+            converted = []
+            convert_message = llm._convert_message
+            llm._convert_message = lambda message: converted.append(message) or convert_message(message)
+            self.assertEqual(llm.run(), "Hot in both")
+
+        self.assertEqual(requests[0]["tools"][0]["function"]["name"], "weather")
+        self.assertEqual(requests[1]["messages"][-2:], [
+            {"role": "tool", "tool_call_id": "call_0", "content": "Chennai: 35C"},
+            {"role": "tool", "tool_call_id": "call_1", "content": "Delhi: 35C"},
+        ])
+        self.assertEqual([message.role for message in llm.conversation.messages], ["system", "user", "assistant", "user", "assistant"])
+        # the second request only converted the tool call and its results
+        self.assertEqual(len(converted), 4)
+
+    def test_invalid_arguments_are_returned_to_the_model(self):
+        requests = []
+        def complete(request):
+            requests.append(json.loads(request["body"]))
+            if len(requests) == 1:
+                response = tool_calls_completion([("weather", {})])
+                response["choices"][0]["message"]["tool_calls"][0]["function"]["arguments"] = '{"city": "Chen'
+                return 200, response
+            return 200, chat_completion("Sorry")
+
+        with StandInServer({"POST /v1/chat/completions": complete}) as server:
+            register_openai_compatible("tools-invalid-stand-in", f"{server.url}/v1", models=["agent"])
+            conversation = Conversation(messages=[
+                {"role": "system", "content": "s"},
+                {"role": "user", "content": [{"type": "text", "text": "Weather?"}]}
+            ])
+            llm = LLM("tools-invalid-stand-in", "agent", model_params={"max_tokens": 100}, conversation=conversation)()
+            llm.add_tool(Tool("weather", lambda city: f"{city}: 35C"))
+            self.assertEqual(llm.run(), "Sorry")
+
+        # one request per step, nothing retried
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(requests[1]["messages"][-2]["tool_calls"][0]["function"]["arguments"], '{"city": "Chen')
+        tool_message = requests[1]["messages"][-1]
+        self.assertEqual(tool_message["role"], "tool")
+        self.assertIn("must be a JSON object", tool_message["content"])
+
+    def test_agent_step_budget(self):
+        def complete(request):
+            return 200, tool_calls_completion([("noop", {})])
+
+        with StandInServer({"POST /v1/chat/completions": complete}) as server:
+            register_openai_compatible("budget-tools-stand-in", f"{server.url}/v1", models=["agent"])
+            conversation = Conversation(messages=[
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": [{"type": "text", "text": "Loop forever"}]}
+            ])
+            llm = LLM("budget-tools-stand-in", "agent", model_params={"max_tokens": 100}, conversation=conversation, stateful=False)()
+            llm.add_tool(Tool("noop", lambda: "ok"))
+            with self.assertRaisesRegex(RuntimeError, "within 3 steps"):
+                llm.run_agent(max_steps=3)
+            # stateless LLMs don't keep the tool exchange
+            self.assertEqual(len(llm.conversation.messages), 2)
+
+if __name__ == '__main__':
+    unittest.main()
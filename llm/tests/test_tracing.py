@@ -0,0 +1,63 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from llm import tracing
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        tracing.clear()
+
+    def tearDown(self):
+        tracing.disable()
+        tracing.clear()
+
+    def test_disabled_records_nothing(self):
+        tracing.disable()
+        with tracing.span("api_call"):
+            pass
+        tracing.instant("retry")
+        self.assertEqual(len(tracing._events), 0)
+
+    def test_export_chrome_trace(self):
+        tracing.enable()
+        with tracing.span("predict", model="gpt-4o"):
+            with tracing.span("api_call"):
+                pass
+        worker = threading.Thread(target=lambda: tracing.instant("retry", attempt=1), name="worker")
+        worker.start()
+        worker.join()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "trace.json")
+            tracing.export_chrome_trace(path)
+            with open(path) as f:
+                events = json.load(f)["traceEvents"]
+
+        spans = {event["name"]: event for event in events if event["ph"] == "X"}
+        self.assertEqual(set(spans), {"predict", "api_call"})
+        self.assertLessEqual(spans["predict"]["ts"], spans["api_call"]["ts"])
+        self.assertGreaterEqual(spans["predict"]["dur"], spans["api_call"]["dur"])
+        self.assertEqual(spans["predict"]["args"], {"model": "gpt-4o"})
+        thread_names = {event["args"]["name"] for event in events if event["ph"] == "M"}
+        self.assertIn("worker", thread_names)
+
+    def test_flush_while_running(self):
+        tracing.enable()
+        with tracing.span("predict"):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, "trace.json")
+                with tracing.span("api_call"):
+                    pass
+                tracing.flush(path)
+                with open(path) as f:
+                    events = json.load(f)["traceEvents"]
+                self.assertEqual(os.listdir(tmp_dir), ["trace.json"])
+        # spans still open when flushing are in the next export
+        self.assertEqual([event["name"] for event in events if event["ph"] == "X"], ["api_call"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import base64
+import json
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from anthropic import Anthropic
+from llm import BaseAnthropic
+from llm.custom_typing import Conversation, UserMessage
+from llm.pool import Endpoint, EndpointPool
+from llm.uploads import FileUploadManager
+from llm.tests.stand_in import StandInServer
+
+IMAGE = base64.b64encode(b"\xff\xd8\xff\xe0 not really a jpeg").decode("utf-8")
+
+
+def anthropic_message(text):
+    return {
+        "id": "msg_1", "type": "message", "role": "assistant", "model": "claude-3-haiku-20240307",
+        "content": [{"type": "text", "text": text}], "stop_reason": "end_turn", "stop_sequence": None,
+        "usage": {"input_tokens": 1, "output_tokens": 1},
+    }
+
+
+def uploaded_file(file_id):
+    return {
+        "id": file_id, "type": "file", "filename": "page.jpeg", "mime_type": "image/jpeg",
+        "size_bytes": 10, "created_at": "2024-01-01T00:00:00Z",
+    }
+
+
+def stand_in_backend(server):
+    class StandInAnthropic(BaseAnthropic):
+        @classmethod
+        def get_pool(cls):
+            if cls.__dict__.get("_pool") is None:
+                cls._pool = EndpointPool([Endpoint("stand-in", Anthropic, api_key="test", base_url=server.url, max_retries=0)])
+            return cls._pool
+    return StandInAnthropic
+
+
+class TestFileUploads(unittest.TestCase):
+
+    def test_manager_uploads_once_and_expires(self):
+        uploads = []
+        deleted = []
+        manager = FileUploadManager(lambda data, media_type, filename: uploads.append(data) or f"file_{len(uploads)}", deleted.append, ttl_seconds=0.2)
+        self.assertEqual(manager.file_id(IMAGE, "image/jpeg"), "file_1")
+        self.assertEqual(manager.file_ids([(IMAGE, "image/jpeg"), (IMAGE, "image/jpeg")]), {IMAGE: "file_1"})
+        self.assertEqual(uploads, [base64.b64decode(IMAGE)])
+        time.sleep(0.25)
+        # the expired file is deleted when it is replaced
+        self.assertEqual(manager.file_id(IMAGE, "image/jpeg"), "file_2")
+        self.assertEqual(deleted, ["file_1"])
+        manager.invalidate(["file_2"])
+        self.assertEqual(deleted, ["file_1", "file_2"])
+        self.assertEqual(manager.file_id(IMAGE, "image/jpeg"), "file_3")
+
+    def test_failed_upload_falls_back_to_inline(self):
+        def fail(data, media_type, filename):
+            raise ConnectionError("storage down")
+        self.assertIsNone(FileUploadManager(fail).file_id(IMAGE, "image/jpeg"))
+
+    def test_failed_uploads_are_tried_once_per_call(self):
+        attempts = []
+        def fail(data, media_type, filename):
+            attempts.append(data)
+            raise ConnectionError("storage down")
+        manager = FileUploadManager(fail)
+        images = [(base64.b64encode(f"image {i}".encode()).decode("utf-8"), "image/jpeg") for i in range(3)]
+        self.assertEqual(manager.file_ids(images), {data: None for data, _ in images})
+        self.assertEqual(len(attempts), 3)
+        # per image upload locks are dropped once the upload is done
+        self.assertEqual(manager._upload_locks, {})
+
+    def test_one_upload_manager_per_endpoint_under_concurrency(self):
+        class SlowManager(FileUploadManager):
+            def __init__(self, *args, **kwargs):
+                time.sleep(0.05)
+                super().__init__(*args, **kwargs)
+
+        with StandInServer({}) as server, patch("llm.anthropic.FileUploadManager", SlowManager):
+            backend = stand_in_backend(server)
+            endpoint = backend.get_pool().endpoints[0]
+            managers = []
+            threads = [threading.Thread(target=lambda: managers.append(backend.get_upload_manager(endpoint))) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len({id(manager) for manager in managers}), 1)
+
+    def test_turns_reference_uploaded_images(self):
+        messages = []
+        def create(request):
+            body = json.loads(request["body"])
+            messages.append(body)
+            if any(block["source"].get("file_id") == "file_expired" for message in body["messages"]
+                   for block in message["content"] if block["type"] == "image"):
+                return 404, {"type": "error", "error": {"type": "not_found_error", "message": "File not found"}}
+            return 200, anthropic_message(f"turn {len(messages)}")
+        file_ids = iter(["file_a", "file_expired", "file_b"])
+        routes = {
+            "POST /v1/files": lambda request: (200, uploaded_file(next(file_ids))),
+            "POST /v1/messages": create,
+            "DELETE /v1/files/file_a": lambda request: (200, {"id": "file_a", "type": "file_deleted"}),
+        }
+
+        with StandInServer(routes) as server:
+            conversation = Conversation(messages=[
+                {"role": "system", "content": "You read documents."},
+                {"role": "user", "content": [
+                    {"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": IMAGE}},
+                    {"type": "text", "text": "Summarize the page"},
+                ]}
+            ])
+            llm = stand_in_backend(server)("claude-3-haiku-20240307", {"max_tokens": 10}, conversation, stateful=True)
+            llm.upload_images = True
+            llm.run()
+            llm.add_message_to_conversation(UserMessage(content=[{"type": "text", "text": "And the title?"}]))
+            llm.run()
+
+            uploads = [request for request in server.requests if request["path"] == "/v1/files"]
+            self.assertEqual(len(uploads), 1)
+            self.assertEqual(messages[1]["messages"][0]["content"][0]["source"], {"type": "file", "file_id": "file_a"})
+            self.assertIn("files-api", server.requests[-1]["headers"]["anthropic-beta"])
+
+            # a file the vendor lost is re-sent inline, and uploaded again next time
+            llm.get_upload_manager(llm.get_pool().endpoints[0]).invalidate()
+            self.assertEqual(server.requests[-1]["path"], "/v1/files/file_a")
+            llm.add_message_to_conversation(UserMessage(content=[{"type": "text", "text": "And the date?"}]))
+            self.assertEqual(llm.run(), "turn 4")
+            self.assertEqual(messages[3]["messages"][0]["content"][0]["source"]["type"], "base64")
+            llm.add_message_to_conversation(UserMessage(content=[{"type": "text", "text": "And the author?"}]))
+            llm.run()
+            self.assertEqual(messages[4]["messages"][0]["content"][0]["source"], {"type": "file", "file_id": "file_b"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import json
+import unittest
+from anthropic import Anthropic
+from llm import BaseAnthropic
+from llm.custom_typing import Conversation
+from llm.openai_compatible import make_openai_compatible_backend
+from llm.pool import Endpoint, EndpointPool
+from llm.voting import majority_vote, json_field_vote, score_vote, get_voter, register_scorer, extract_json
+from llm.tests.stand_in import StandInServer, chat_completion
+from llm.tests.test_uploads import anthropic_message
+
+
+def conversation():
+    return Conversation(messages=[{"role": "system", "content": "s"}, {"role": "user", "content": [{"type": "text", "text": "q"}]}])
+
+
+class TestVoting(unittest.TestCase):
+
+    def test_majority_vote(self):
+        self.assertEqual(majority_vote(["Paris", "paris ", "Lyon", "Lyon", "Lyon"]), 2)
+        self.assertEqual(majority_vote(["a", "b", "b", "a"]), 0)
+
+    def test_json_field_vote(self):
+        candidates = [
+            'Here you go: {"answer": {"value": 41}, "why": "x"}',
+            "not json",
+            '```json\n{"answer": {"value": 42}, "why": "y"}\n```',
+            '{"answer": {"value": 42}, "why": "z"}',
+        ]
+        self.assertEqual(json_field_vote("answer.value")(candidates), 2)
+        self.assertEqual(json_field_vote("missing")(["b", "a", "a"]), 1)
+        self.assertIsNone(extract_json("no braces"))
+
+    def test_scorers(self):
+        self.assertEqual(score_vote(len)(["ab", "abcd", "abc"]), 1)
+        register_scorer("shortest", lambda candidate: -len(candidate))
+        self.assertEqual(get_voter("shortest")(["ab", "a", "abc"]), 1)
+        with self.assertRaises(ValueError):
+            get_voter("nope")
+        with self.assertRaises(ValueError):
+            get_voter("json_field")
+
+
+class TestSampling(unittest.TestCase):
+
+    def test_openai_samples_in_one_request(self):
+        def create(request):
+            body = json.loads(request["body"])
+            response = chat_completion("unused")
+            response["choices"] = [
+                {"index": i, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+                for i, text in enumerate(["B", "A", "B"][:body.get("n", 1)])
+            ]
+            return 200, response
+
+        with StandInServer({"POST /v1/chat/completions": create}) as server:
+            backend = make_openai_compatible_backend("sampler", server.url + "/v1", models=["m"])
+            llm = backend("m", {"max_tokens": 10}, conversation())
+            winner, candidates = llm.sample(3)
+            self.assertEqual((winner, candidates), ("B", ["B", "A", "B"]))
+            self.assertEqual(len(server.requests), 1)
+            self.assertEqual(json.loads(server.requests[0]["body"])["n"], 3)
+            self.assertEqual(llm.get_latest_assistant_message(text=True), "B")
+
+    def test_openai_tops_up_when_n_is_ignored(self):
+        with StandInServer({"POST /v1/chat/completions": lambda request: (200, chat_completion("same"))}) as server:
+            backend = make_openai_compatible_backend("ignores-n", server.url + "/v1", models=["m"])
+            llm = backend("m", {"max_tokens": 10}, conversation(), stateful=False)
+            winner, candidates = llm.sample(3)
+            self.assertEqual(candidates, ["same"] * 3)
+            self.assertEqual(len(server.requests), 3)
+            self.assertEqual(len(llm.conversation.messages), 2)
+
+    def test_anthropic_samples_share_one_payload(self):
+        answers = iter(["X", "Y", "Y", "Z"])
+        with StandInServer({"POST /v1/messages": lambda request: (200, anthropic_message(next(answers)))}) as server:
+            class StandInAnthropic(BaseAnthropic):
+                @classmethod
+                def get_pool(cls):
+                    if cls.__dict__.get("_pool") is None:
+                        cls._pool = EndpointPool([Endpoint("stand-in", Anthropic, api_key="test", base_url=server.url, max_retries=0)])
+                    return cls._pool
+
+            llm = StandInAnthropic("claude-3-haiku-20240307", {"max_tokens": 10}, conversation())
+            winner, candidates = llm.sample(4)
+            self.assertEqual(winner, "Y")
+            self.assertEqual(sorted(candidates), ["X", "Y", "Y", "Z"])
+            bodies = {request["body"] for request in server.requests}
+            self.assertEqual((len(server.requests), len(bodies)), (4, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import math
+from threading import Lock
+from typing import Dict, Optional
+
+# share of the context window kept free to absorb errors of the local token estimate
+SAFETY_MARGIN = 0.05
+# never ask for less than this; a prompt leaving less of a known context window is rejected
+MIN_OUTPUT_TOKENS = 256
+# reserved before anything was observed for a key (the previous fixed default); max_tokens counts against
+# tokens-per-minute rate limits, so the model's full max output is only reserved once outputs need it
+DEFAULT_OUTPUT_TOKENS = 4000
+# headroom over the output length previously observed for the same key
+OBSERVED_HEADROOM = 1.5
+# weight of the newest observation in the moving average
+OBSERVED_DECAY = 0.5
+
+_observed_output_tokens: Dict[str, float] = {}
+_observed_lock = Lock()
+
+
+class ContextWindowExceeded(ValueError):
+    """
+    the prompt leaves less than MIN_OUTPUT_TOKENS of the model's context window; not retried
+    """
+
+
+def record_output_tokens(key: str, tokens: int):
+    with _observed_lock:
+        previous = _observed_output_tokens.get(key)
+        if previous is None:
+            _observed_output_tokens[key] = float(tokens)
+        else:
+            # react to longer outputs immediately, decay slowly towards shorter ones
+            _observed_output_tokens[key] = max(float(tokens), OBSERVED_DECAY * tokens + (1 - OBSERVED_DECAY) * previous)
+
+
+def observed_output_tokens(key: str) -> Optional[float]:
+    return _observed_output_tokens.get(key)
+
+
+def size_max_tokens(
+    prompt_tokens: int,
+    context_window: Optional[int],
+    max_output_tokens: int,
+    observed: Optional[float] = None
+) -> int:
+    """
+    max_tokens for a request: DEFAULT_OUTPUT_TOKENS on first use, then the output length observed so far plus headroom,
+    bounded by the model's max output and what is left of the context window after the prompt.
+    An unknown (None) context window doesn't bound it: the server knows its window, a guess would only cut outputs short
+    """
+    if observed is None:
+        wanted = DEFAULT_OUTPUT_TOKENS
+    else:
+        wanted = max(MIN_OUTPUT_TOKENS, math.ceil(observed * OBSERVED_HEADROOM))
+    if context_window is None:
+        return min(wanted, max_output_tokens)
+
+    remaining = context_window - prompt_tokens - int(context_window * SAFETY_MARGIN)
+    if remaining < MIN_OUTPUT_TOKENS:
+        raise ContextWindowExceeded(
+            f"Prompt of ~{prompt_tokens} tokens leaves only {remaining} tokens of the {context_window} token context window, "
+            f"shorten it or set max_tokens"
+        )
+    return min(wanted, max_output_tokens, remaining)
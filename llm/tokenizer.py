@@ -0,0 +1,95 @@
+import io
+import re
+import json
+import base64
+from collections import OrderedDict
+from threading import Lock
+from typing import Tuple
+import numpy as np
+from PIL import Image
+from .custom_typing import Conversation
+from .uploads import content_hash
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+_PIECES_SPLIT = re.compile(r"(\w+|[^\w\s])")
+# role markers and separators every message costs
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_text_tokens(text: str) -> int:
+    """
+    fast local estimate of BPE tokens: one token per punctuation mark, short words are one token
+    and longer (or non-english) words cost roughly one token per six characters.
+    The one estimate used for prompt sizing, chunking and embedding batches.
+    """
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        tokens += 1 + len(piece) // 6
+    return tokens
+
+
+def token_pieces(text: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    start offsets, end offsets and estimated tokens of every piece of text estimate_text_tokens counts,
+    to cut text at a token budget
+    """
+    # alternating separators and pieces, so offsets follow from the lengths alone
+    parts = _PIECES_SPLIT.split(text)
+    lengths = np.fromiter(map(len, parts), dtype=np.int64, count=len(parts))
+    ends = np.cumsum(lengths)[1::2]
+    piece_lengths = lengths[1::2]
+    return ends - piece_lengths, ends, 1 + piece_lengths // 6
+
+
+# content hash -> (width, height), keyed by hash so the cache doesn't keep the images alive
+_IMAGE_SIZES: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+_IMAGE_SIZES_MAX = 256
+_image_sizes_lock = Lock()
+
+
+def image_size(data: str) -> Tuple[int, int]:
+    key = content_hash(data)
+    with _image_sizes_lock:
+        if key in _IMAGE_SIZES:
+            _IMAGE_SIZES.move_to_end(key)
+            return _IMAGE_SIZES[key]
+    # PIL only parses the header to get the size
+    size = Image.open(io.BytesIO(base64.b64decode(data))).size
+    with _image_sizes_lock:
+        _IMAGE_SIZES[key] = size
+        if len(_IMAGE_SIZES) > _IMAGE_SIZES_MAX:
+            _IMAGE_SIZES.popitem(last=False)
+    return size
+
+
+def estimate_image_tokens(width: int, height: int, vendor: str) -> int:
+    if vendor == "anthropic":
+        # images are scaled to at most 1568px on the long edge and ~1.15 megapixels, at width * height / 750 tokens
+        scale = min(1.0, 1568 / max(width, height), (1150000 / max(width * height, 1)) ** 0.5)
+        return int(width * scale * height * scale / 750) + 1
+    # openai high detail: fit in 2048x2048, shortest side to 768, 170 tokens per 512px tile plus 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = -(-int(width) // 512) * -(-int(height) // 512)
+    return 85 + 170 * tiles
+
+
+def estimate_conversation_tokens(conversation: Conversation, vendor: str = "openai") -> int:
+    tokens = 0
+    for message in conversation.messages:
+        tokens += MESSAGE_OVERHEAD_TOKENS
+        if isinstance(message.content, str):
+            tokens += estimate_text_tokens(message.content)
+            continue
+        for content_item in message.content:
+            if content_item.type == "text":
+                tokens += estimate_text_tokens(content_item.text)
+            elif content_item.type == "image":
+                tokens += estimate_image_tokens(*image_size(content_item.source.data), vendor)
+            elif content_item.type == "tool_use":
+                tokens += estimate_text_tokens(content_item.name) + estimate_text_tokens(json.dumps(content_item.input))
+            elif content_item.type == "tool_result":
+                tokens += estimate_text_tokens(content_item.content)
+    return tokens
@@ -0,0 +1,127 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional
+from loguru import logger
+from .custom_typing import ToolUseContent, ToolResultContent
+from .tracing import span
+
+_pool = None
+_pool_lock = Lock()
+
+
+def get_tool_pool() -> ThreadPoolExecutor:
+    """
+    separate from llm.executor, so tools called from a background prediction can't starve it
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=int(os.getenv("COMFYUI_LLM_MAX_TOOL_WORKERS", 16)), thread_name_prefix="comfyui-llm-tool")
+        return _pool
+
+
+class Tool:
+    """
+    A python function the model can call.
+
+    parameters is the JSON schema of the keyword arguments fn takes; fn returns a string (anything else is JSON encoded).
+    Results of cacheable tools are reused for identical arguments.
+    """
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        description: str = "",
+        parameters: Dict[str, Any] = None,
+        timeout: float = 30.0,
+        cacheable: bool = True
+    ):
+        self.name = name
+        self.fn = fn
+        self.description = description or (fn.__doc__ or "").strip()
+        self.parameters = parameters or {"type": "object", "properties": {}}
+        self.timeout = timeout
+        self.cacheable = cacheable
+
+    def __call__(self, **kwargs) -> str:
+        result = self.fn(**kwargs)
+        return result if isinstance(result, str) else json.dumps(result, default=str)
+
+
+class ToolExecutor:
+    """
+    Runs all tool calls of one model turn concurrently (identical calls of a cacheable tool once), each bounded by its tool's timeout
+    (and the remaining budget of the agent loop, if a deadline is given).
+    Failures and timeouts are returned to the model as error results instead of raising.
+    """
+    def __init__(self, tools: List[Tool]):
+        self.tools = {tool.name: tool for tool in tools}
+        self._cache: Dict[str, str] = {}
+        self._cache_lock = Lock()
+
+    @staticmethod
+    def _cache_key(call: ToolUseContent) -> str:
+        return json.dumps([call.name, call.input], sort_keys=True, default=str)
+
+    def _call(self, call: ToolUseContent) -> str:
+        with span("tool_call", tool=call.name):
+            return self.tools[call.name](**call.input)
+
+    def run(self, calls: List[ToolUseContent], deadline: Optional[float] = None) -> List[ToolResultContent]:
+        futures = {}
+        results = {}
+        # identical calls of a cacheable tool in one turn run once: cache key -> id of the call that runs,
+        # call id -> id of the call whose result it shares
+        running: Dict[str, str] = {}
+        shared: Dict[str, str] = {}
+        for call in calls:
+            tool = self.tools.get(call.name)
+            if tool is None:
+                results[call.id] = ToolResultContent(tool_use_id=call.id, content=f"Unknown tool: {call.name}", is_error=True)
+                continue
+            if call.invalid_input is not None:
+                results[call.id] = ToolResultContent(tool_use_id=call.id, content=f"Arguments of {call.name} must be a JSON object, got: {call.invalid_input}", is_error=True)
+                continue
+            if tool.cacheable:
+                key = self._cache_key(call)
+                with self._cache_lock:
+                    cached = self._cache.get(key)
+                if cached is not None:
+                    logger.debug("Reusing cached result of tool {}", call.name)
+                    results[call.id] = ToolResultContent(tool_use_id=call.id, content=cached)
+                    continue
+                if key in running:
+                    shared[call.id] = running[key]
+                    continue
+                running[key] = call.id
+            # each tool's timeout runs from its submission, not from when its result is waited for
+            submitted = time.monotonic()
+            call_deadline = submitted + tool.timeout
+            if deadline is not None:
+                call_deadline = min(call_deadline, deadline)
+            futures[call.id] = (call, tool, call_deadline - submitted, call_deadline, get_tool_pool().submit(self._call, call))
+
+        for call_id, (call, tool, allowed, call_deadline, future) in futures.items():
+            timeout = max(0.0, call_deadline - time.monotonic())
+            try:
+                content = future.result(timeout=timeout)
+                results[call_id] = ToolResultContent(tool_use_id=call_id, content=content)
+                if tool.cacheable:
+                    with self._cache_lock:
+                        self._cache[self._cache_key(call)] = content
+            except TimeoutError:
+                # the thread can't be interrupted, its result is discarded
+                future.cancel()
+                logger.warning("Tool {} timed out after {:.1f}s", call.name, allowed)
+                results[call_id] = ToolResultContent(tool_use_id=call_id, content=f"Tool {call.name} timed out after {allowed:.1f}s", is_error=True)
+            except Exception as e:
+                logger.warning("Tool {} failed: {}", call.name, e)
+                results[call_id] = ToolResultContent(tool_use_id=call_id, content=f"Tool {call.name} failed: {e}", is_error=True)
+
+        for call_id, source_id in shared.items():
+            results[call_id] = results[source_id].model_copy(update={"tool_use_id": call_id})
+
+        return [results[call.id] for call in calls]
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import atexit
+import threading
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+TRACE_FILE = os.getenv("COMFYUI_LLM_TRACE_FILE")
+MAX_EVENTS = int(os.getenv("COMFYUI_LLM_TRACE_MAX_EVENTS", 100000))
+# also write the trace file every this many seconds, not only at exit
+FLUSH_SECONDS = float(os.getenv("COMFYUI_LLM_TRACE_FLUSH_SECONDS", 0))
+
+_enabled = bool(TRACE_FILE)
+_events = deque(maxlen=MAX_EVENTS)
+_thread_names = {}
+_origin_ns = time.perf_counter_ns()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def clear():
+    _events.clear()
+
+
+def _now_us() -> float:
+    return (time.perf_counter_ns() - _origin_ns) / 1000
+
+
+def _tid() -> int:
+    thread = threading.current_thread()
+    _thread_names.setdefault(thread.ident, thread.name)
+    return thread.ident
+
+
+@contextmanager
+def span(name: str, **args):
+    """
+    records the time spent in the block as a complete ("X") event; a no-op unless tracing is enabled
+    """
+    if not _enabled:
+        yield
+        return
+    start = _now_us()
+    try:
+        yield
+    finally:
+        _events.append({
+            "name": name,
+            "ph": "X",
+            "ts": start,
+            "dur": _now_us() - start,
+            "pid": os.getpid(),
+            "tid": _tid(),
+            "args": args,
+        })
+
+
+def instant(name: str, **args):
+    if not _enabled:
+        return
+    _events.append({
+        "name": name,
+        "ph": "i",
+        "s": "t",
+        "ts": _now_us(),
+        "pid": os.getpid(),
+        "tid": _tid(),
+        "args": args,
+    })
+
+
+def traced(name: str):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_retry(retry_state):
+    """
+    tenacity before_sleep hook
+    """
+    instant(
+        "retry",
+        function=retry_state.fn.__qualname__ if retry_state.fn else None,
+        attempt=retry_state.attempt_number,
+        sleep_seconds=retry_state.next_action.sleep if retry_state.next_action else None,
+        error=repr(retry_state.outcome.exception()) if retry_state.outcome else None,
+    )
+
+
+def export_chrome_trace(path: str):
+    """
+    writes the recorded events in the Chrome trace event format, which chrome://tracing and ui.perfetto.dev open
+    """
+    events = list(_events)
+    metadata = [
+        {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": _thread_names.get(tid, str(tid))}}
+        for tid in {event["tid"] for event in events}
+    ]
+    # written next to the target and moved into place, so a trace opened while flushing is never half written
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f, default=str)
+    os.replace(tmp_path, path)
+
+
+def flush(path: str = None):
+    """
+    exports the events recorded so far without waiting for the process to exit, to COMFYUI_LLM_TRACE_FILE by default
+    """
+    path = path or TRACE_FILE
+    if not path:
+        raise ValueError("No trace file, pass a path or set COMFYUI_LLM_TRACE_FILE")
+    export_chrome_trace(path)
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        flush()
+
+
+if TRACE_FILE:
+    atexit.register(flush)
+    if FLUSH_SECONDS > 0:
+        threading.Thread(target=_flush_periodically, name="trace-flush", daemon=True).start()
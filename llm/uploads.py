@@ -0,0 +1,126 @@
+import base64
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from loguru import logger
+from .tracing import span
+
+# how long an uploaded file is referenced before it is uploaded again
+DEFAULT_FILE_TTL_SECONDS = 24 * 60 * 60
+
+
+def content_hash(data: str) -> str:
+    # not cached: a cache keyed by data would keep every image it saw in memory
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class FileUploadManager:
+    """
+    Uploads each distinct image once to a vendor's file storage and remembers the returned file id by content hash.
+
+    upload_fn takes (raw bytes, media type, file name) and returns the file id. Failed uploads return None from file_id,
+    so callers fall back to sending the image inline.
+    delete_fn takes a file id and deletes the file; files that expire or are invalidated are deleted with it,
+    vendors keep files until they are deleted, so without it every re-upload leaves a stale copy behind.
+    """
+    def __init__(
+        self,
+        upload_fn: Callable[[bytes, str, str], str],
+        delete_fn: Optional[Callable[[str], Any]] = None,
+        ttl_seconds: float = DEFAULT_FILE_TTL_SECONDS,
+        max_concurrency: int = 4
+    ):
+        self.upload_fn = upload_fn
+        self.delete_fn = delete_fn
+        self.ttl_seconds = ttl_seconds
+        self.max_concurrency = max_concurrency
+        # content hash -> (file id, expires at)
+        self._files: Dict[str, Tuple[str, float]] = {}
+        # one lock per content hash, so concurrent requests with the same image upload it once
+        self._upload_locks: Dict[str, Lock] = {}
+        self._lock = Lock()
+
+    def _cached(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._files.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() < entry[1]:
+                return entry[0]
+            del self._files[key]
+        self._delete([entry[0]])
+        return None
+
+    def _delete(self, file_ids: List[str]):
+        # best effort, a file the vendor already lost can't be deleted
+        if self.delete_fn is None:
+            return
+        for file_id in file_ids:
+            try:
+                with span("delete_file"):
+                    self.delete_fn(file_id)
+            except Exception as e:
+                logger.debug("Deleting file {} failed: {}", file_id, e)
+
+    def file_id(self, data: str, media_type: str) -> Optional[str]:
+        """
+        file id for base64 encoded image data, uploading it if it wasn't uploaded (or has expired)
+        """
+        return self._file_id(content_hash(data), data, media_type)
+
+    def _file_id(self, key: str, data: str, media_type: str) -> Optional[str]:
+        file_id = self._cached(key)
+        if file_id is not None:
+            return file_id
+
+        with self._lock:
+            upload_lock = self._upload_locks.setdefault(key, Lock())
+        try:
+            with upload_lock:
+                file_id = self._cached(key)
+                if file_id is not None:
+                    return file_id
+                extension = media_type.split("/")[-1]
+                try:
+                    with span("upload_file", media_type=media_type, size=len(data)):
+                        file_id = self.upload_fn(base64.b64decode(data), media_type, f"{key[:16]}.{extension}")
+                except Exception as e:
+                    logger.warning("Uploading file failed, sending it inline: {}", e)
+                    return None
+                with self._lock:
+                    self._files[key] = (file_id, time.monotonic() + self.ttl_seconds)
+        finally:
+            # callers already waiting keep their reference, later ones find the file id in _files
+            with self._lock:
+                if self._upload_locks.get(key) is upload_lock:
+                    del self._upload_locks[key]
+        logger.debug("Uploaded file {} as {}", key[:16], file_id)
+        return file_id
+
+    def file_ids(self, images: Iterable[Tuple[str, str]]) -> Dict[str, Optional[str]]:
+        """
+        file ids for (data, media type) pairs, keyed by data; missing images are uploaded concurrently,
+        each at most once per call
+        """
+        distinct = {data: media_type for data, media_type in images}
+        keys = {data: content_hash(data) for data in distinct}
+        file_ids = {data: self._cached(keys[data]) for data in distinct}
+        missing = [data for data, file_id in file_ids.items() if file_id is None]
+        upload = lambda data: self._file_id(keys[data], data, distinct[data])
+        if len(missing) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(missing))) as executor:
+                file_ids.update(zip(missing, executor.map(upload, missing)))
+        else:
+            file_ids.update((data, upload(data)) for data in missing)
+        return file_ids
+
+    def invalidate(self, file_ids: List[str] = None):
+        """
+        forgets (and deletes) the given file ids (all if None), e.g. after a request referencing them failed
+        """
+        with self._lock:
+            stale = [entry[0] for entry in self._files.values() if file_ids is None or entry[0] in file_ids]
+            self._files = {key: entry for key, entry in self._files.items() if entry[0] not in stale}
+        self._delete(stale)
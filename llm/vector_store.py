@@ -0,0 +1,134 @@
+import os
+import json
+import hashlib
+from threading import Lock
+from typing import Dict, List, Optional
+import numpy as np
+
+DEFAULT_VECTOR_DIR = os.path.join(os.path.expanduser("~"), ".cache", "comfyui-llm", "vectors")
+
+_stores: Dict[str, "VectorStore"] = {}
+_stores_lock = Lock()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class VectorStore:
+    """
+    Append-only on-disk store of fixed size vectors keyed by content hash, read through a memory map.
+
+    A store directory holds meta.json (dim, dtype), vectors.bin (rows in insertion order) and keys.txt (one key per row,
+    line i naming row i). Rows are written before their keys; rows without a key (left by a crash mid-append) are cut off
+    before the next read or append, and rows appended by another instance are picked up first.
+    """
+    def __init__(self, path: str, dtype: str = "float32"):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+        self._rows: Dict[str, int] = {}
+        # rows in vectors.bin, duplicate keys written by concurrent instances still take up a row
+        self._count = 0
+        self._map = None
+        self._lock = Lock()
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _row_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    def _load(self):
+        if not os.path.exists(self._file("meta.json")):
+            return
+        with open(self._file("meta.json")) as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.dtype = np.dtype(meta["dtype"])
+
+        keys = []
+        if os.path.exists(self._file("keys.txt")):
+            with open(self._file("keys.txt")) as f:
+                keys = f.read().split()
+        vectors_path = self._file("vectors.bin")
+        rows_on_disk = os.path.getsize(vectors_path) // self._row_bytes() if os.path.exists(vectors_path) else 0
+        if len(keys) > rows_on_disk:
+            raise ValueError(f"Vector store {self.path} is corrupt: {len(keys)} keys but {rows_on_disk} rows")
+        if os.path.exists(vectors_path) and os.path.getsize(vectors_path) != len(keys) * self._row_bytes():
+            # rows without keys from an interrupted append
+            os.truncate(vectors_path, len(keys) * self._row_bytes())
+
+        self._rows = {}
+        for row, key in enumerate(keys):
+            self._rows.setdefault(key, row)
+        self._count = len(keys)
+        self._map = None
+
+    def _sync(self):
+        # reloads if vectors.bin doesn't end where this instance's last append did
+        vectors_path = self._file("vectors.bin")
+        size = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+        if self.dim is None or size != self._count * self._row_bytes():
+            self._load()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key: str):
+        return key in self._rows
+
+    def _vectors(self) -> np.ndarray:
+        if self._map is None or len(self._map) != self._count:
+            self._map = np.memmap(self._file("vectors.bin"), dtype=self.dtype, mode="r", shape=(self._count, self.dim))
+        return self._map
+
+    def get(self, keys: List[str]) -> np.ndarray:
+        """
+        float32 (len(keys), dim) array of stored vectors, raises KeyError for missing keys
+        """
+        with self._lock:
+            if not keys:
+                return np.zeros((0, self.dim or 0), dtype=np.float32)
+            rows = np.fromiter((self._rows[key] for key in keys), dtype=np.int64, count=len(keys))
+            return np.asarray(self._vectors()[rows], dtype=np.float32)
+
+    def add(self, keys: List[str], vectors: np.ndarray):
+        vectors = np.asarray(vectors)
+        with self._lock:
+            self._sync()
+            new = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._rows and key not in new:
+                    new[key] = vector
+            if not new:
+                return
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self._file("meta.json"), "w") as f:
+                    json.dump({"dim": self.dim, "dtype": self.dtype.name}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected vectors of dimension {self.dim}, got {vectors.shape[1]}")
+
+            with open(self._file("vectors.bin"), "ab") as f:
+                f.write(np.asarray(list(new.values()), dtype=self.dtype).tobytes())
+            with open(self._file("keys.txt"), "a") as f:
+                f.write("".join(f"{key}\n" for key in new))
+            for key in new:
+                self._rows[key] = self._count
+                self._count += 1
+
+
+def get_vector_store(vendor: str, model: str) -> VectorStore:
+    """
+    the store of one embedding model under COMFYUI_LLM_VECTOR_DIR, in COMFYUI_LLM_VECTOR_DTYPE (float32 or float16)
+    """
+    path = os.path.join(os.getenv("COMFYUI_LLM_VECTOR_DIR", DEFAULT_VECTOR_DIR), vendor, model.replace("/", "_"))
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = VectorStore(path, dtype=os.getenv("COMFYUI_LLM_VECTOR_DTYPE", "float32"))
+        return _stores[path]
@@ -0,0 +1,93 @@
+import json
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+# picks the winning candidate, returns its index
+Voter = Callable[[List[str]], int]
+
+# name -> fn(candidate) -> score, higher is better
+SCORERS: Dict[str, Callable[[str], float]] = {}
+
+
+def register_scorer(name: str, scorer: Callable[[str], float]):
+    SCORERS[name] = scorer
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _first_most_common(keys: List[Any]) -> int:
+    """
+    index of the first candidate with the most common key (None keys never win)
+    """
+    counts = Counter(key for key in keys if key is not None)
+    if not counts:
+        return 0
+    top = max(counts.values())
+    return next(i for i, key in enumerate(keys) if key is not None and counts[key] == top)
+
+
+def majority_vote(candidates: List[str]) -> int:
+    """
+    the most frequent answer, compared ignoring case and whitespace; ties go to the earlier candidate
+    """
+    return _first_most_common([_normalize(candidate) for candidate in candidates])
+
+
+def extract_json(text: str) -> Optional[Any]:
+    """
+    the JSON object in text, also when wrapped in prose or a code fence; None if there is none
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        return None
+    try:
+        return json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+
+
+def json_field_vote(field: str) -> Voter:
+    """
+    votes on the value of one field ("a.b" for nested fields) of JSON answers; unparsable answers don't vote,
+    if no answer has the field it falls back to majority_vote
+    """
+    def vote(candidates: List[str]) -> int:
+        keys = []
+        for candidate in candidates:
+            value = extract_json(candidate)
+            for part in field.split("."):
+                value = value.get(part) if isinstance(value, dict) else None
+            keys.append(json.dumps(value, sort_keys=True) if value is not None else None)
+        if all(key is None for key in keys):
+            return majority_vote(candidates)
+        return _first_most_common(keys)
+    return vote
+
+
+def score_vote(scorer: Callable[[str], float]) -> Voter:
+    """
+    the candidate with the highest score; ties go to the earlier candidate
+    """
+    def vote(candidates: List[str]) -> int:
+        scores = [scorer(candidate) for candidate in candidates]
+        return scores.index(max(scores))
+    return vote
+
+
+def get_voter(strategy: str = "majority", field: str = "") -> Voter:
+    if strategy == "majority":
+        return majority_vote
+    if strategy == "json_field":
+        if not field:
+            raise ValueError("json_field voting requires a field")
+        return json_field_vote(field)
+    if strategy in SCORERS:
+        return score_vote(SCORERS[strategy])
+    raise ValueError(f"Unknown voting strategy: {strategy}")
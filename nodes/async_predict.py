@@ -0,0 +1,57 @@
+from ..llm.executor import submit
+from .predict import PredictV2
+
+
+class PredictHandle:
+    def __init__(self, future, llm):
+        self.future = future
+        self.llm = llm
+
+    def result(self, timeout=None):
+        return self.future.result(timeout=timeout)
+
+
+class PredictSubmit(PredictV2):
+    """
+    Starts a PredictV2 call in the background and returns immediately, so independent branches
+    of the graph keep executing while the request is in flight. Pair with Predict Await.
+    """
+    RETURN_TYPES = ("LLM_FUTURE",)
+    FUNCTION = "submit"
+
+    def _predict(self, llm, system_prompt, user_prompt, images):
+        return self.prompt_and_run(llm, system_prompt, user_prompt, images)
+
+    def submit(self, system_prompt, user_prompt, model_details, images=[], unique_id=None):
+        llm = model_details
+        if not llm.session_id:
+            # parallel branches sharing one model each continue their own fork of the conversation (O(1)),
+            # and nodes downstream of the model don't see it change mid-flight; a session has one history,
+            # its runs are serialized by llm.run_lock instead
+            llm = llm.clone()
+        llm.budget_key = unique_id
+        future = submit(self._predict, llm, system_prompt, user_prompt, images)
+        return (PredictHandle(future, llm),)
+
+
+class PredictAwait:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "handle": ("LLM_FUTURE", {"forceInput": True}),
+            },
+            "optional": {
+                # 0 waits forever
+                "timeout_seconds": ("FLOAT", {"default": 0.0, "min": 0.0}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING", "MODEL",)
+    FUNCTION = "wait"
+    OUTPUT_NODE = True
+    CATEGORY = "🤖 LLM"
+
+    def wait(self, handle, timeout_seconds=0.0):
+        output_text = handle.result(timeout=timeout_seconds or None)
+        return (output_text, handle.llm)
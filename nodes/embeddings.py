@@ -0,0 +1,47 @@
+from ..llm.chunking import split_text
+from ..llm.embeddings import embed_cached, top_k_similar
+from ..llm.vector_store import get_vector_store
+
+
+class SimilaritySearch:
+    """
+    Top-k passages of a document most similar to a query by embedding, using the vendor of the connected model.
+    Embeddings are stored on disk by content hash, so each passage is only embedded once.
+    """
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "model_details": ("MODEL", {"forceInput": True}),
+                "text": ("STRING", {"multiline": False, "forceInput": True, "default": ""}),
+                "query": ("STRING", {"multiline": True, "default": ""}),
+                "top_k": ("INT", {"default": 5, "min": 1, "max": 100}),
+                "chunk_tokens": ("INT", {"default": 200, "min": 20}),
+                "chunk_overlap_tokens": ("INT", {"default": 20, "min": 0}),
+            },
+            "optional": {
+                # the vendor's default embedding model if empty
+                "embedding_model": ("STRING", {"multiline": False, "default": ""}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("passages",)
+    FUNCTION = "search"
+    OUTPUT_NODE = True
+    CATEGORY = "🤖 LLM"
+
+    def search(self, model_details, text, query, top_k, chunk_tokens, chunk_overlap_tokens, embedding_model=""):
+        backend = type(model_details)
+        model = embedding_model or backend.EMBEDDING_MODEL
+        if model is None:
+            raise ValueError(f"Vendor {model_details.vendor} has no default embedding model, set embedding_model")
+        # the default overlap would be as long as the smallest chunks
+        passages = split_text(text or "", chunk_tokens, min(chunk_overlap_tokens, chunk_tokens - 1))
+        if not passages:
+            return ("",)
+
+        store = get_vector_store(model_details.vendor, model)
+        vectors = embed_cached(backend, passages + [query], store, model=model)
+        results = top_k_similar(vectors[-1], vectors[:-1], top_k)
+        return ("\n\n".join(passages[i] for i, _ in results),)
@@ -0,0 +1,21 @@
+class ForkConversation:
+    """
+    Branches one conversation into independent follow-ups. Every output is a separate LLM whose conversation
+    shares the messages so far with the input (no copies), so predictions on one branch never show up in another.
+    """
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "model_details": ("MODEL", {"forceInput": True}),
+            }
+        }
+
+    RETURN_TYPES = ("MODEL", "MODEL", "MODEL", "MODEL",)
+    RETURN_NAMES = ("branch_1", "branch_2", "branch_3", "branch_4",)
+    FUNCTION = "fork"
+    OUTPUT_NODE = True
+    CATEGORY = "🤖 LLM"
+
+    def fork(self, model_details):
+        return tuple(model_details.clone() for _ in self.RETURN_TYPES)
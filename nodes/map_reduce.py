@@ -0,0 +1,64 @@
+from ..llm.chunking import split_text
+from ..llm.map_reduce import MapReduce as MapReduceRunner, Chunk, DEFAULT_MAP_PROMPT, DEFAULT_REDUCE_PROMPT
+from .utils import images_to_base64
+
+try:
+    from comfy.utils import ProgressBar
+except ImportError:
+    ProgressBar = None
+
+
+class MapReduce:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "model_details": ("MODEL", {"forceInput": True}),
+                "map_prompt": ("STRING", {"multiline": True, "default": DEFAULT_MAP_PROMPT}),
+                "reduce_prompt": ("STRING", {"multiline": True, "default": DEFAULT_REDUCE_PROMPT}),
+                "chunk_tokens": ("INT", {"default": 3000, "min": 100}),
+                "chunk_overlap_tokens": ("INT", {"default": 200, "min": 0}),
+                "images_per_chunk": ("INT", {"default": 4, "min": 1}),
+                "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 64}),
+                "reduce_fan_in": ("INT", {"default": 4, "min": 2}),
+            },
+            "optional": {
+                "system_prompt": ("STRING", {"multiline": False, "forceInput": True, "default": ""}),
+                "text": ("STRING", {"multiline": False, "forceInput": True, "default": ""}),
+                "images": ("IMAGE", {"multiple": True}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING", "STRING",)
+    RETURN_NAMES = ("result", "partials",)
+    FUNCTION = "map_reduce"
+    OUTPUT_NODE = True
+    CATEGORY = "🤖 LLM"
+
+    def map_reduce(self, model_details, map_prompt, reduce_prompt, chunk_tokens, chunk_overlap_tokens, images_per_chunk,
+                   max_concurrency, reduce_fan_in, system_prompt="", text="", images=[]):
+        # the default overlap is longer than chunks of less than 200 tokens
+        chunks = [Chunk(text=chunk) for chunk in split_text(text or "", chunk_tokens, min(chunk_overlap_tokens, chunk_tokens - 1))]
+
+        if len(images) > 0:
+            images_base64 = [img_url.split(",")[1] for img_url in images_to_base64(images)]
+            for start in range(0, len(images_base64), images_per_chunk):
+                chunks.append(Chunk(images=images_base64[start:start + images_per_chunk]))
+
+        on_progress = None
+        if ProgressBar is not None:
+            progress_bar = ProgressBar(1)
+            def on_progress(done, total):
+                progress_bar.update_absolute(done, total)
+
+        runner = MapReduceRunner(
+            model_details,
+            map_prompt=map_prompt,
+            reduce_prompt=reduce_prompt,
+            system_prompt=system_prompt,
+            max_concurrency=max_concurrency,
+            fan_in=reduce_fan_in,
+            on_progress=on_progress
+        )
+        result, partials = runner.run(chunks)
+        return (result, "\n\n".join(partials))
@@ -1,5 +1,7 @@
+from loguru import logger
 from ..llm import LLM, Conversation
-from ..llm.constants import flat_vendor_models
+from ..llm.registry import flat_vendor_models
+from ..llm.session import SESSION_REGISTRY
 
 class Model:
     @classmethod
@@ -29,13 +31,18 @@ class ModelV2:
             "required": {
                 "model_name": (flat_vendor_models(), {"default": "openai/gpt-4o"}),
                 "stateful": ("BOOLEAN", {"default": False}),
-                "max_tokens": ("INT", {"default": 4000, "min": 1}),
+                # 0 sizes max_tokens per request from the prompt size, the model limits and previous outputs
+                "max_tokens": ("INT", {"default": 0, "min": 0}),
                 "temperature": ("FLOAT", {"default": 0.5, "min": 0.0, "max": 1.0}),
             },
-            # "optional": {
-            #     "complete_if_out_of_tokens": ("BOOLEAN", {"default": True}),
-            #     "cleanup_out_of_token_completion": ("BOOLEAN", {"default": True}),
-            # }
+            "optional": {
+                # reuses the same LLM (and its conversation) across executions
+                "session_id": ("STRING", {"default": ""}),
+                # upload images once and reference them by file id on later turns (Anthropic only)
+                "upload_images": ("BOOLEAN", {"default": False}),
+                # "complete_if_out_of_tokens": ("BOOLEAN", {"default": True}),
+                # "cleanup_out_of_token_completion": ("BOOLEAN", {"default": True}),
+            }
         }
 
     RETURN_TYPES = ("MODEL",)
@@ -43,10 +50,17 @@ class ModelV2:
     OUTPUT_NODE = True
     CATEGORY = "🤖 LLM"
 
-    def set_params(self, model_name, stateful, max_tokens, temperature):
+    def set_params(self, model_name, stateful, max_tokens, temperature, session_id="", upload_images=False):
         model_params = {"max_tokens": max_tokens, "temperature": temperature}
-        vendor, model_name = model_name.split("/")
-        llm = LLM(vendor, model_name, model_params, stateful=stateful)()
+        # model names of self-hosted models can contain "/" themselves
+        vendor, model_name = model_name.split("/", 1)
+        if session_id:
+            llm = SESSION_REGISTRY.get_or_create(session_id, vendor, model_name, model_params, stateful=stateful)
+        else:
+            llm = LLM(vendor, model_name, model_params, stateful=stateful)()
+        if upload_images and not llm.SUPPORTS_FILE_UPLOADS:
+            logger.warning("{} does not support file uploads, images are sent inline", vendor)
+        llm.upload_images = upload_images and llm.SUPPORTS_FILE_UPLOADS
         return (llm,)
 
     @classmethod
@@ -1,20 +1,14 @@
 import os
-import openai
-from anthropic import Anthropic
-from openai import OpenAI
 from ..llm import LLM, Conversation, SystemMessage, UserMessage
+from ..llm.session import SESSION_REGISTRY
+from ..llm.tracing import span
+from .utils import images_to_base64
 from PIL import Image
 import numpy as np
 import base64
 import io
 
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-anthropic_client = anthropic = Anthropic(api_key=ANTHROPIC_API_KEY)
-
 
 class Predict:
     @classmethod
@@ -74,7 +68,8 @@ class Predict:
                     {"type": "text", "text": user_prompt},
                 ]}
             ]
-            response = openai_client.chat.completions.create(
+            from ..llm.openai import BaseOpenAI
+            response = BaseOpenAI.get_client().chat.completions.create(
                 model=model,
                 messages=messages,
                 max_tokens=max_tokens
@@ -88,7 +83,8 @@ class Predict:
                     {"type": "text", "text": user_prompt},
                 ]}
             ]
-            response = anthropic_client.messages.create(
+            from ..llm.anthropic import BaseAnthropic
+            response = BaseAnthropic.get_client().messages.create(
                 model=model,
                 max_tokens=max_tokens,
                 messages=messages
@@ -117,6 +113,9 @@ class PredictV2:
                 "images": ("IMAGE", {"multiple": True}),
                 # "complete_if_out_of_tokens": ("BOOLEAN", {"default": True}),
                 # "cleanup_out_of_token_completion": ("BOOLEAN", {"default": True}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
             }
         }
 
@@ -126,40 +125,21 @@ class PredictV2:
     CATEGORY = "🤖 LLM"
 
     def images_to_base64(self, images):
-        images_base64 = []
-        for (batch_number, image) in enumerate(images):
-            i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-
-            # Resize the image to a maximum width or height of 1024 pixels
-            max_size = 1024
-            img.thumbnail((max_size, max_size), Image.LANCZOS)
-
-            # Convert to RGB mode if the image is in RGBA mode
-            if img.mode == 'RGBA':
-                img = img.convert('RGB')
-
-            # Save as JPEG with reduced quality
-            buffer = io.BytesIO()
-            img.save(buffer, format="JPEG", quality=85)
-            img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-
-            images_base64.append(f"data:image/jpeg;base64,{img_base64}")
-        return images_base64
-
-    def predict(self, system_prompt, user_prompt, model_details, images=[]):
-        llm = model_details
+        return images_to_base64(images)
 
+    def add_prompt_to_conversation(self, llm, system_prompt, user_prompt, images=[]):
         if len(images) > 0:
-            images_base64 = self.images_to_base64(images)
+            with span("images_to_base64", num_images=len(images)):
+                images_base64 = self.images_to_base64(images)
         else:
             images_base64 = []
 
-        system_message = SystemMessage(content=system_prompt)
-        user_message = UserMessage(content=[
-            *[{"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": img_url.split(",")[1]}} for img_url in images_base64],
-            {"type": "text", "text": user_prompt},
-        ])
+        with span("build_messages"):
+            system_message = SystemMessage(content=system_prompt)
+            user_message = UserMessage(content=[
+                *[{"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": img_url.split(",")[1]}} for img_url in images_base64],
+                {"type": "text", "text": user_prompt},
+            ])
         messages = [system_message, user_message]
 
         if len(llm.conversation.messages) == 0:
@@ -174,7 +154,32 @@ class PredictV2:
                 # since its not stateful, we need to replace the conversation
                 llm.conversation = Conversation(messages=messages)
 
-        output_text = llm.run()
+    def run(self, llm):
+        with span("predict", vendor=llm.vendor, model=llm.model):
+            output_text = llm.run()
+        if llm.session_id:
+            SESSION_REGISTRY.sync(llm)
+        return output_text
+
+    def prompt_and_run(self, llm, system_prompt, user_prompt, images=[], run=None):
+        """
+        adds the prompt and runs the LLM (self.run by default); a failed run rolls the conversation back, so an LLM
+        that is reused (stateful, or a session) isn't left with an unanswered prompt
+        """
+        with llm.run_lock:
+            before = llm.conversation.fork()
+            self.add_prompt_to_conversation(llm, system_prompt, user_prompt, images)
+            try:
+                return (run or self.run)(llm)
+            except Exception:
+                llm.conversation = before
+                raise
+
+    def predict(self, system_prompt, user_prompt, model_details, images=[], unique_id=None):
+        llm = model_details
+        # max_tokens is sized from the output lengths previously observed for this node
+        llm.budget_key = unique_id
+        output_text = self.prompt_and_run(llm, system_prompt, user_prompt, images)
 
         return (output_text, llm)
 
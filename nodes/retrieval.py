@@ -0,0 +1,29 @@
+from ..llm.retrieval import retrieve
+
+
+class Retrieve:
+    """
+    Top-k passages of a document for a query (BM25, offline), to put into a Prompt Builder instead of the whole document.
+    """
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "text": ("STRING", {"multiline": False, "forceInput": True, "default": ""}),
+                "query": ("STRING", {"multiline": True, "default": ""}),
+                "top_k": ("INT", {"default": 5, "min": 1, "max": 100}),
+                "chunk_tokens": ("INT", {"default": 200, "min": 20}),
+                "chunk_overlap_tokens": ("INT", {"default": 20, "min": 0}),
+            }
+        }
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("passages",)
+    FUNCTION = "retrieve"
+    OUTPUT_NODE = True
+    CATEGORY = "🤖 LLM"
+
+    def retrieve(self, text, query, top_k, chunk_tokens, chunk_overlap_tokens):
+        # the default overlap would be as long as the smallest chunks
+        passages = retrieve(text or "", query, top_k, chunk_tokens, min(chunk_overlap_tokens, chunk_tokens - 1))
+        return ("\n\n".join(passages),)
@@ -0,0 +1,44 @@
+import json
+from ..llm.session import SESSION_REGISTRY
+from ..llm.tracing import span
+from ..llm.voting import SCORERS, get_voter
+from .predict import PredictV2
+
+
+class PredictSamples(PredictV2):
+    """
+    Generates n answers to the same prompt (one request with OpenAI's n, concurrent requests sharing one payload
+    with Anthropic) and picks one by majority vote, by voting on a JSON field, or with a registered scorer.
+    """
+    @classmethod
+    def INPUT_TYPES(cls):
+        input_types = super().INPUT_TYPES()
+        input_types["required"] = {
+            **input_types["required"],
+            "n": ("INT", {"default": 5, "min": 1, "max": 32}),
+            "vote": (["majority", "json_field", *SCORERS],),
+        }
+        input_types["optional"] = {
+            **input_types["optional"],
+            # for json_field voting, "a.b" for nested fields
+            "json_field": ("STRING", {"multiline": False, "default": ""}),
+        }
+        return input_types
+
+    RETURN_TYPES = ("STRING", "STRING", "MODEL",)
+    RETURN_NAMES = ("winner", "candidates", "model_details",)
+    FUNCTION = "predict_samples"
+
+    def predict_samples(self, system_prompt, user_prompt, model_details, n, vote, images=[], json_field="", unique_id=None):
+        llm = model_details
+        llm.budget_key = unique_id
+        voter = get_voter(vote, json_field)
+        winner, candidates = self.prompt_and_run(llm, system_prompt, user_prompt, images, run=lambda llm: self.run_samples(llm, n, voter))
+        return (winner, json.dumps(candidates), llm)
+
+    def run_samples(self, llm, n, voter):
+        with span("predict_samples", vendor=llm.vendor, model=llm.model, n=n):
+            winner, candidates = llm.sample(n, voter)
+        if llm.session_id:
+            SESSION_REGISTRY.sync(llm)
+        return winner, candidates
@@ -0,0 +1,26 @@
+from PIL import Image
+import numpy as np
+import base64
+import io
+
+
+def images_to_base64(images, max_size=1024):
+    images_base64 = []
+    for (batch_number, image) in enumerate(images):
+        i = 255. * image.cpu().numpy()
+        img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
+
+        # Resize the image to a maximum width or height of max_size pixels
+        img.thumbnail((max_size, max_size), Image.LANCZOS)
+
+        # Convert to RGB mode if the image is in RGBA mode
+        if img.mode == 'RGBA':
+            img = img.convert('RGB')
+
+        # Save as JPEG with reduced quality
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=85)
+        img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+        images_base64.append(f"data:image/jpeg;base64,{img_base64}")
+    return images_base64